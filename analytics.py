@@ -0,0 +1,192 @@
+"""Offline statistics over the archived games (games.jsonl).
+
+Usage:
+    python analytics.py games.jsonl [--workers 4] [--chunk-size 2000] [--json]
+
+The archive is streamed in chunks of lines, so memory stays flat no matter
+how many games are in it. Each chunk is crunched by a worker process and
+the partial counters are merged as they come back.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool
+
+SCORE_BUCKET = 50  # Width of one bar in the per-round score histogram
+
+
+def new_totals():
+    return {
+        'games': Counter(),
+        'bid_hits': Counter(),       # (cards_to_deal, seat) -> bids made exactly
+        'bid_total': Counter(),      # (cards_to_deal, seat) -> bids placed
+        'premia_kept': Counter(),    # phase -> players still holding Premia at phase end
+        'premia_total': Counter(),   # phase -> players reaching a phase end
+        'joker_success': Counter(),  # TAKE/GIVE -> Joker did what it asked for
+        'joker_total': Counter(),
+        'scores': Counter(),         # (round_index, bucket) -> players
+        'round_scores': Counter(),   # phase -> player scores recorded
+        'deleted': Counter(),        # phase -> scores wiped by an opponent's Premia
+        'doubled': Counter(),        # phase -> scores doubled by the player's own Premia
+    }
+
+
+def add_game(totals, record):
+    turn_order = record['turn_order']
+    totals['games']['count'] += 1
+
+    rounds = record['rounds']
+    for position, rnd in enumerate(rounds):
+        round_index = rnd['round_index']
+        cards = rnd['cards_to_deal']
+        # Phase boundaries come from the record, whatever schedule the engine ran
+        is_phase_end = position + 1 == len(rounds) or rounds[position + 1]['phase'] != rnd['phase']
+
+        for sid, entry in rnd['players'].items():
+            # Seat 1 bids first, seat 4 is the dealer
+            seat = (turn_order.index(sid) - rnd['dealer_index'] - 1) % 4 + 1
+            totals['bid_total'][(cards, seat)] += 1
+            if entry['won'] == entry['bid']:
+                totals['bid_hits'][(cards, seat)] += 1
+
+            # A deleted score is worth nothing in the end (points_earned keeps the old value)
+            points = 0 if entry['is_deleted'] else entry['points_earned']
+            bucket = (points // SCORE_BUCKET) * SCORE_BUCKET
+            totals['scores'][(round_index, bucket)] += 1
+
+            totals['round_scores'][rnd['phase']] += 1
+            if entry['is_deleted']: totals['deleted'][rnd['phase']] += 1
+            if entry['is_doubled']: totals['doubled'][rnd['phase']] += 1
+
+            if is_phase_end:
+                totals['premia_total'][rnd['phase']] += 1
+                if entry['premia']:
+                    totals['premia_kept'][rnd['phase']] += 1
+
+        for joker in rnd['jokers']:
+            action = joker['action']
+            totals['joker_total'][action] += 1
+            # A TAKE wants the trick, a GIVE wants to lose it
+            if joker['won'] == (action == 'TAKE'):
+                totals['joker_success'][action] += 1
+
+
+def crunch_chunk(lines):
+    totals = new_totals()
+    for line in lines:
+        line = line.strip()
+        if not line: continue
+        add_game(totals, json.loads(line))
+    return totals
+
+
+def read_chunks(path, chunk_size):
+    with open(path) as f:
+        while True:
+            chunk = list(islice(f, chunk_size))
+            if not chunk: return
+            yield chunk
+
+
+def compute(path, workers=None, chunk_size=2000):
+    totals = new_totals()
+    chunks = read_chunks(path, chunk_size)
+
+    if workers == 1:
+        partials = map(crunch_chunk, chunks)
+        for partial in partials:
+            for key in totals: totals[key].update(partial[key])
+        return totals
+
+    with Pool(workers or os.cpu_count()) as pool:
+        for partial in pool.imap_unordered(crunch_chunk, chunks):
+            for key in totals: totals[key].update(partial[key])
+    return totals
+
+
+def ratio(hits, total):
+    return round(hits / total, 4) if total else None
+
+
+def summarize(totals):
+    return {
+        'games': totals['games']['count'],
+        'bid_accuracy': [
+            {'cards_to_deal': cards, 'seat': seat, 'bids': total,
+             'accuracy': ratio(totals['bid_hits'][(cards, seat)], total)}
+            for (cards, seat), total in sorted(totals['bid_total'].items())
+        ],
+        'premia_keep_rate': [
+            {'phase': phase, 'players': total, 'rate': ratio(totals['premia_kept'][phase], total)}
+            for phase, total in sorted(totals['premia_total'].items())
+        ],
+        'premia_effects': [
+            {'phase': phase, 'scores': total,
+             'deleted_rate': ratio(totals['deleted'][phase], total),
+             'doubled_rate': ratio(totals['doubled'][phase], total)}
+            for phase, total in sorted(totals['round_scores'].items())
+        ],
+        'joker_success_rate': [
+            {'action': action, 'plays': total, 'rate': ratio(totals['joker_success'][action], total)}
+            for action, total in sorted(totals['joker_total'].items())
+        ],
+        'score_distribution': [
+            {'round': round_index + 1, 'bucket': bucket, 'count': count}
+            for (round_index, bucket), count in sorted(totals['scores'].items())
+        ],
+    }
+
+
+def print_report(summary):
+    print(f"Games analysed: {summary['games']}")
+
+    print("\nBid accuracy (cards / seat):")
+    for row in summary['bid_accuracy']:
+        print(f"  {row['cards_to_deal']} cards, seat {row['seat']}: {row['accuracy']:.1%} of {row['bids']} bids")
+
+    print("\nPremia keep rate:")
+    for row in summary['premia_keep_rate']:
+        print(f"  Phase {row['phase']}: {row['rate']:.1%} of {row['players']}")
+
+    print("\nPremia effects on round scores:")
+    for row in summary['premia_effects']:
+        print(f"  Phase {row['phase']}: {row['deleted_rate']:.1%} deleted, {row['doubled_rate']:.1%} doubled of {row['scores']}")
+
+    print("\nJoker success rate:")
+    for row in summary['joker_success_rate']:
+        print(f"  {row['action']}: {row['rate']:.1%} of {row['plays']} plays")
+
+    print("\nScore distribution per round, deleted scores as 0 (bucket: players):")
+    current_round = None
+    for row in summary['score_distribution']:
+        if row['round'] != current_round:
+            current_round = row['round']
+            print(f"  Round {current_round}:")
+        print(f"    {row['bucket']:>6}: {row['count']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate statistics over archived Joker games.")
+    parser.add_argument('archive', help="Path to the games.jsonl archive")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="Games per work unit")
+    parser.add_argument('--json', action='store_true', help="Print the raw summary as JSON")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.archive):
+        print(f"No archive at {args.archive}", file=sys.stderr)
+        return 1
+
+    summary = summarize(compute(args.archive, args.workers, args.chunk_size))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,19 @@
 import os
-from flask import Flask, render_template, request, session
-from flask_socketio import SocketIO, emit
+import json
+import signal
+import sys
+import time
+import functools
+from flask import Flask, render_template, request, session, abort
+from flask_socketio import SocketIO
 from game_engine import JokerGame
+from outbox import Outbox
+from ratings import Leaderboard
+from replay import ReplayRecorder, ReplayLibrary
+from chat import ChatChannel
+from lobby import Lobby, BOT_BACKFILL_SECONDS
+import bots
+import profiler
 
 # Setup Paths
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -11,16 +23,274 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'joker_secret_key'
 socketio = SocketIO(app, async_mode='eventlet')
 
+# Set JOKER_DEAL_SEED to deal every table the same cards (duplicate tournaments, benchmarks)
+DEAL_SEED = int(os.environ['JOKER_DEAL_SEED']) if os.environ.get('JOKER_DEAL_SEED') else None
+
+def new_table():
+    return JokerGame(seed=DEAL_SEED)
+
+# Where the old process leaves the live table for the new one during a deploy
+STATE_FILE = os.environ.get('JOKER_STATE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'joker_state.json'))
+
+# Idle tables are parked in STATE_FILE too, and thrown away if nobody comes back
+IDLE_SECONDS = int(os.environ.get('JOKER_IDLE_SECONDS', 15 * 60))
+REAP_SECONDS = int(os.environ.get('JOKER_REAP_SECONDS', 24 * 60 * 60))
+
+def load_handoff_state():
+    # Pick up the table the previous process (or hibernation) left behind
+    if not os.path.exists(STATE_FILE):
+        return new_table(), set()
+    try:
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+        if time.time() - state.get('saved_at', time.time()) > REAP_SECONDS:
+            print(f"🧹 Table in {STATE_FILE} was abandoned, starting fresh.")
+            return new_table(), set()
+        print(f"♻️  Restored table from {STATE_FILE}")
+        return JokerGame.from_state(state['game']), set(state.get('play_again_votes', []))
+    except (OSError, ValueError, KeyError, TypeError) as e: # TypeError: saved by an older layout
+        print(f"⚠️  Could not restore table from {STATE_FILE}: {e}")
+        return new_table(), set()
+    finally:
+        # One-shot: never resurrect the same table twice
+        try: os.remove(STATE_FILE)
+        except OSError: pass
+
+def save_handoff_state():
+    # Write to a temp file first so the new process never reads half a table
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'saved_at': time.time(),
+            'game': game.to_state(),
+            'play_again_votes': sorted(play_again_votes)
+        }, f, separators=(',', ':'))
+    os.replace(tmp_path, STATE_FILE)
+
+# Handlers sleep between steps (trick animation, premia logs, round scoring), so
+# a deploy waits this long for them to finish before the table is written out
+SHUTDOWN_GRACE_SECONDS = int(os.environ.get('JOKER_SHUTDOWN_GRACE_SECONDS', 15))
+shutting_down = False
+
+def handle_shutdown(signum, frame):
+    # Deploys send SIGTERM: stop taking events, then hand the table over
+    global shutting_down
+    if shutting_down: return
+    shutting_down = True
+    socketio.start_background_task(finish_shutdown)
+
+def finish_shutdown():
+    deadline = time.time() + SHUTDOWN_GRACE_SECONDS
+    while busy_handlers and time.time() < deadline:
+        socketio.sleep(0.1)
+    if busy_handlers:
+        print(f"⚠️  {busy_handlers} handler(s) still running after {SHUTDOWN_GRACE_SECONDS}s, saving anyway.")
+        
+    # (a hibernating table is already on disk)
+    if game is not None: save_handoff_state()
+    print(f"💾 Table saved to {STATE_FILE}, shutting down.")
+    sys.exit(0)
+
+# Every finished game is appended here as one JSON line (read by analytics.py)
+ARCHIVE_FILE = os.environ.get('JOKER_ARCHIVE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'games.jsonl'))
+
+def archive_finished_game():
+    try:
+        with open(ARCHIVE_FILE, 'a') as f:
+            f.write(json.dumps(game.get_archive_record()) + '\n')
+    except OSError as e:
+        print(f"⚠️  Could not archive game {game.game_id}: {e}")
+
+# Player ratings survive restarts and play-again resets
+RATINGS_FILE = os.environ.get('JOKER_RATINGS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ratings.json'))
+leaderboard = Leaderboard(RATINGS_FILE)
+leaderboard_cache = {}  # (top, player) -> response body, valid for leaderboard_cache_version
+leaderboard_cache_version = None
+LEADERBOARD_CACHE_SIZE = 1024  # ?player= is free text, so cap it
+
+# Every table event is recorded here so finished (or running) games can be replayed
+REPLAY_DIR = os.environ.get('JOKER_REPLAY_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'replays'))
+replay_recorder = ReplayRecorder(REPLAY_DIR)
+replay_library = ReplayLibrary(REPLAY_DIR)
+replay_viewers = {}  # viewer sid -> stream number (bumped to cancel the old stream)
+
+# New players queue here and get seated in matched groups once the table is free
+LOBBY_BOT_SECONDS = int(os.environ.get('JOKER_BOT_BACKFILL_SECONDS', BOT_BACKFILL_SECONDS))
+LOBBY_TICK_SECONDS = 1
+LOBBY_STATUS_SECONDS = 30  # How often queued players hear how things stand
+# A table nobody human is connected to is given to the queue after this long
+TABLE_ABANDON_SECONDS = int(os.environ.get('JOKER_TABLE_ABANDON_SECONDS', 120))
+lobby = Lobby(bot_backfill_seconds=LOBBY_BOT_SECONDS)
+table_abandoned_since = None
+
 # Initialize the Game Engine
-game = JokerGame()
-play_again_votes = set()
+game, play_again_votes = load_handoff_state()
+last_activity = time.time()
+busy_handlers = 0
+
+# --- HIBERNATION: Park idle tables on disk, wake them on the next event ---
+def hibernate_table():
+    global game
+    save_handoff_state()
+    game = None
+    print(f"😴 Table idle for {IDLE_SECONDS}s, hibernated to {STATE_FILE}")
+
+def wake_table():
+    global game, play_again_votes
+    if game is None:
+        game, play_again_votes = load_handoff_state()
+
+def idle_watcher():
+    while True:
+        socketio.sleep(30)
+        idle_for = time.time() - last_activity
+        
+        # Never pull the table away from a handler that is mid-trick (or from a queue waiting for it)
+        if game is not None and busy_handlers == 0 and game.players and idle_for > IDLE_SECONDS and not len(lobby):
+            hibernate_table()
+        elif game is None and idle_for > REAP_SECONDS and os.path.exists(STATE_FILE):
+            os.remove(STATE_FILE)
+            print("🧹 Reaped abandoned table.")
+
+def table_event(handler):
+    # Every socket handler goes through here so a sleeping table wakes up first
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        global last_activity, busy_handlers
+        if shutting_down: return # Dropped: the new process re-sends turn prompts on reconnect
+        wake_table()
+        busy_handlers += 1
+        try:
+            return profiler.run(handler, *args, **kwargs)
+        finally:
+            busy_handlers -= 1
+            last_activity = time.time()
+    return wrapper
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/stats')
+def stats():
+    if game is None:
+        return {'game_phase': 'HIBERNATING', 'table_bytes': 0, 'outbound': outbox.metrics(), 'lobby': lobby.metrics()}
+    return {
+        'game_id': game.game_id,
+        'game_phase': game.game_phase,
+        'table_bytes': game.memory_footprint(),
+        'outbound': outbox.metrics(),
+        'lobby': lobby.metrics()
+    }
+
+@app.route('/leaderboard')
+def leaderboard_page():
+    global leaderboard_cache_version
+    try: top = int(request.args.get('top', 10))
+    except ValueError: abort(400)
+    top = max(1, min(top, 100))
+    player = request.args.get('player')
+    etag = f'"{leaderboard.version}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304
+
+    if leaderboard_cache_version != leaderboard.version:
+        leaderboard_cache.clear() # Only the current version is worth keeping
+        leaderboard_cache_version = leaderboard.version
+
+    key = (top, player)
+    if key not in leaderboard_cache:
+        if len(leaderboard_cache) >= LEADERBOARD_CACHE_SIZE: leaderboard_cache.clear()
+        body = {'top': leaderboard.top(top)}
+        if player: body['player'] = leaderboard.rank(player)
+        leaderboard_cache[key] = body
+    return leaderboard_cache[key], 200, {'ETag': etag, 'Cache-Control': 'public, max-age=30'}
+
+# --- REPLAYS ---
+@app.route('/replays')
+def list_replays():
+    return {'games': replay_library.list_games()}
+
+@app.route('/replay/<game_id>')
+def replay_page(game_id):
+    if not replay_library.exists(game_id): abort(404)
+    return render_template('index.html', replay_game_id=game_id)
+
+@app.route('/replay/<game_id>/keyframes')
+def replay_keyframes(game_id):
+    if not replay_library.exists(game_id): abort(404)
+    return {'keyframes': [{'round': k['round'], 'trick': k['trick']} for k in replay_library.keyframes(game_id)]}
+
+@socketio.on('watch_replay', namespace='/replay')
+def handle_watch_replay(data):
+    # Also used to seek: a new request replaces the viewer's current stream
+    sid = request.sid
+    game_id = data.get('game_id')
+    if not replay_library.exists(game_id):
+        socketio.emit('error_message', {'msg': "Replay not found!"}, to=sid, namespace='/replay')
+        return
+    
+    stream_number = replay_viewers.get(sid, 0) + 1
+    replay_viewers[sid] = stream_number
+    speed = min(max(float(data.get('speed') or 1), 0.25), 16)
+    socketio.start_background_task(stream_replay, sid, stream_number, game_id,
+                                   data.get('round'), data.get('trick'), speed)
+
+@socketio.on('disconnect', namespace='/replay')
+def handle_replay_disconnect():
+    replay_viewers.pop(request.sid, None)
+
+def stream_replay(sid, stream_number, game_id, round_number, trick, speed):
+    seated = False
+    for pause, event, data in replay_library.stream(game_id, round_number, trick):
+        if pause: socketio.sleep(pause / speed)
+        if replay_viewers.get(sid) != stream_number: return # Viewer left or seeked elsewhere
+        
+        # Watch from the first seat's point of view
+        if event == 'update_player_list' and not seated and data['players']:
+            socketio.emit('your_id', {'sid': data['players'][0]['sid']}, to=sid, namespace='/replay')
+            seated = True
+        socketio.emit(event, data, to=sid, namespace='/replay')
+        
+    socketio.emit('log_message', {'msg': "⏹️ End of replay."}, to=sid, namespace='/replay')
+
+# --- ADMIN: Live profiling (disabled unless JOKER_ADMIN_TOKEN is set) ---
+ADMIN_TOKEN = os.environ.get('JOKER_ADMIN_TOKEN')
+
+def require_admin():
+    token = request.headers.get('X-Admin-Token') or request.args.get('token')
+    if not ADMIN_TOKEN or token != ADMIN_TOKEN:
+        abort(403)
+
+@app.route('/admin/profile', methods=['POST'])
+def start_profile():
+    require_admin()
+    seconds = float(request.args.get('seconds', 60))
+    if request.args.get('mode') == 'sample':
+        interval = float(request.args.get('interval', 0.005))
+        profile = profiler.start_sampling_session(seconds, interval)
+    else:
+        target = request.args.get('handler')
+        if not target: abort(400)
+        profile = profiler.start_handler_session(target, int(request.args.get('calls', 20)), seconds)
+    return profile.summary()
+
+@app.route('/admin/profile')
+def list_profiles():
+    require_admin()
+    return {'sessions': [s.summary() for s in profiler.sessions.values()]}
+
+@app.route('/admin/profile/<int:session_id>')
+def profile_report(session_id):
+    require_admin()
+    profile = profiler.sessions.get(session_id)
+    if profile is None: abort(404)
+    if request.args.get('format') == 'collapsed':
+        return profile.collapsed(), 200, {'Content-Type': 'text/plain'}
+    return profile.report()
+
 # --- HELPER FUNCTION: Send Scores ---
-def broadcast_scores():
+def score_payload():
     score_data = []
     for sid in game.turn_order:
         if sid not in game.players: continue
@@ -28,7 +298,7 @@ def broadcast_scores():
         bid = game.bids.get(sid, 0) # Default 0 if not bid yet
         tricks = game.tricks_won.get(sid, 0)
         has_bid = (sid in game.bids)
-        total_score = game.players[sid]['score']
+        total_score = game.players[sid].score
         
         score_data.append({
             'sid': sid,
@@ -39,13 +309,198 @@ def broadcast_scores():
             'premia': game.premia_eligible.get(sid, True)
         })
 
-    emit('update_scores', {
+    return {
         'scores': score_data,
-        'history': game.score_history, # Send the scoreboard data
+        'history': game.history_payload(), # Send the scoreboard data
         'turn_order': game.turn_order  # Keep columns in correct order
-    }, broadcast=True)
+    }
+
+def broadcast_scores():
+    emit('update_scores', score_payload(), broadcast=True)
+
+def player_list_payload():
+    return {'players': [{'sid': pid, 'name': game.players[pid].name} for pid in game.turn_order]}
+
+def turn_prompt(sid):
+    # The "your turn" popup this player should be looking at right now (if any)
+    if game.get_current_bidder_id() != sid: return None
+    if game.game_phase == "DECLARING":
+        return 'your_turn_to_declare', {}
+    if game.game_phase == "BIDDING":
+        return 'your_turn_to_bid', {'forbidden': game.get_forbidden_bid(sid)}
+    if game.game_phase == "PLAYING" and game.tricks_played_in_round < game.cards_to_deal:
+        return 'your_turn_to_play', {
+            'is_leader': len(game.current_trick_cards) == 0,
+            'valid_indices': game.get_valid_moves(sid)
+        }
+    return None
+
+def table_prompts(sid):
+    # Table-wide popups this player still has to answer (they may have missed the broadcast)
+    prompts = []
+    if game.awaiting_next_round() and sid not in game.ready_for_next_round:
+        prompts.append(('show_end_round_scoreboard', {}))
+    return prompts
+
+def resync_messages(sid):
+    # Replaces a slow client's overflowing queue: just enough to redraw the table
+    wake_table()
+    messages = [('update_player_list', player_list_payload())]
+    if sid in game.players:
+        messages.append(('sync_game_state', game.get_reconnect_state(sid)))
+    messages.append(('update_scores', score_payload()))
+    prompt = turn_prompt(sid)
+    if prompt: messages.append(prompt)
+    return messages
+
+# --- OUTBOUND: Every message goes through the slow-client-proof outbox ---
+outbox = Outbox(socketio, resync=resync_messages)
+
+def emit(event, data, room=None, broadcast=False):
+    if (broadcast or event == 'new_round') and game is not None:
+        replay_recorder.record(game.game_id, event, data)
+    if broadcast: outbox.broadcast(event, data)
+    else: outbox.send(room, event, data)
+    if game is not None and (broadcast or bots.is_bot(room)):
+        prompt_bots(event, data, room)
+
+# --- CHAT: One channel per table, identity comes from the seat ---
+table_chat = None
+table_chat_id = None # game_id of the table table_chat belongs to
+
+def chat_channel():
+    # A new table gets a new channel, so the next group never sees the last one's talk
+    global table_chat, table_chat_id
+    if table_chat_id != game.game_id:
+        table_chat = ChatChannel(socketio, deliver=functools.partial(deliver_chat, game.game_id))
+        table_chat_id = game.game_id
+    return table_chat
+
+def deliver_chat(game_id, batch):
+    # Only to the people seated at that table, never to the lobby or the next table
+    if game is None or game.game_id != game_id: return
+    for sid in game.turn_order:
+        if not bots.is_bot(sid): emit('receive_chat_batch', {'messages': batch}, room=sid)
+
+@socketio.on('connect')
+def handle_connect():
+    outbox.connect(request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    outbox.disconnect(request.sid)
+    lobby.leave(request.sid)
+
+# --- BOTS: Bot seats get the same prompts as humans and answer them from a background task ---
+# (Seat 0, which starts the round after the ace hunt, is always a human: the lobby seats them first)
+BOT_TABLE_EVENTS = {'enable_ready_btn', 'show_end_round_scoreboard', 'game_over_event'}
+
+def prompt_bots(event, data, room):
+    if bots.is_bot(room):
+        socketio.start_background_task(run_bot, room, event, data)
+    elif event in BOT_TABLE_EVENTS:
+        for sid in game.turn_order:
+            if bots.is_bot(sid): socketio.start_background_task(run_bot, sid, event, data)
+
+def nudge_bots():
+    # After a restore nobody re-sends the prompts the bots were waiting on
+    for sid in game.turn_order:
+        if not bots.is_bot(sid): continue
+        prompt = turn_prompt(sid)
+        for event, data in ([prompt] if prompt else []) + table_prompts(sid):
+            socketio.start_background_task(run_bot, sid, event, data)
+
+def run_bot(sid, event, data):
+    socketio.sleep(bots.THINK_SECONDS)
+    if game is None or sid not in game.players: return # Table was reset meanwhile
+
+    with app.test_request_context('/'):
+        request.sid = sid
+        if event in ('your_turn_to_declare', 'your_turn_to_bid', 'your_turn_to_play'):
+            if game.get_current_bidder_id() != sid: return # Stale prompt
+            
+        if event == 'your_turn_to_declare':
+            handle_declaration({'suit': bots.choose_trump(game.players[sid].hand)})
+        elif event == 'your_turn_to_bid':
+            handle_bid({'amount': bots.choose_bid(game, sid, game.get_forbidden_bid(sid))})
+        elif event == 'your_turn_to_play':
+            index, action, suit = bots.choose_play(game, sid, game.get_valid_moves(sid))
+            handle_play_card({'card_index': index, 'joker_action': action, 'joker_suit': suit})
+        elif event == 'enable_ready_btn':
+            handle_ready()
+        elif event == 'show_end_round_scoreboard':
+            handle_ready_next_round()
+        elif event == 'game_over_event':
+            handle_play_again()
+
+# --- LOBBY: Seat the best-matched group whenever the table is empty ---
+@table_event
+def seat_group(humans, bot_count):
+    for entry in humans:
+        game.add_player(entry.sid, entry.name)
+        emit('your_id', {'sid': entry.sid}, room=entry.sid)
+        emit('chat_history', {'messages': chat_channel().recent()}, room=entry.sid)
+    for number in range(1, bot_count + 1):
+        game.add_player(*bots.bot_identity(game.game_id, number))
+        
+    emit('update_player_list', player_list_payload(), broadcast=True)
+    names = ", ".join(game.players[sid].name for sid in game.turn_order)
+    emit('log_message', {'msg': f"🪑 New table: {names}"}, broadcast=True)
+    if len(game.turn_order) == 4:
+        emit('enable_ready_btn', {}, broadcast=True)
+
+def table_status():
+    if not game.turn_order: return "Finding you a table..."
+    if game.round_number: return f"The table is playing round {game.round_number} of {len(game.round_schedule)}."
+    return "The table is about to start a game."
+
+def release_abandoned_table():
+    # Only bots (or nobody) left at a table people are queueing for: start over
+    global table_abandoned_since
+    humans_online = any(sid in outbox.clients for sid in game.turn_order if not bots.is_bot(sid))
+    if humans_online or not game.turn_order:
+        table_abandoned_since = None
+        return
+    if table_abandoned_since is None:
+        table_abandoned_since = time.time()
+    elif time.time() - table_abandoned_since > TABLE_ABANDON_SECONDS and busy_handlers == 0:
+        # (A bot's handler may still be asleep in the trick pause; wait for it)
+        reset_table()
+        table_abandoned_since = None
+        print(f"🧹 No player connected to the table for {TABLE_ABANDON_SECONDS}s, released it to the lobby.")
+
+@table_event
+def reset_table():
+    global game
+    game = new_table()
+    play_again_votes.clear()
+
+def lobby_watcher():
+    last_status = time.time()
+    while True:
+        socketio.sleep(LOBBY_TICK_SECONDS)
+        if not len(lobby): continue
+        if game is None: wake_table() # People are queueing for it
         
+        release_abandoned_table()
+        if not game.turn_order:
+            for humans, bot_count in lobby.tick(max_tables=1):
+                seat_group(humans, bot_count)
+        elif time.time() - last_status > LOBBY_STATUS_SECONDS:
+            last_status = time.time()
+            status = table_status()
+            waiting = sorted(lobby.entries.values(), key=lambda e: e.joined_at)
+            for position, entry in enumerate(waiting, start=1):
+                emit('log_message', {'msg': f"⏳ {status} You are #{position} in the queue."}, room=entry.sid)
+
+@socketio.on('lobby_pong')
+def handle_lobby_pong(data):
+    # Round trip of the ping sent on join, in ms
+    try: lobby.set_latency(request.sid, max(0, time.time() * 1000 - float(data['t'])))
+    except (KeyError, TypeError, ValueError): pass
+
 @socketio.on('join_game')
+@table_event
 def handle_join(data):
     username = data['username']
     sid = request.sid
@@ -53,18 +508,21 @@ def handle_join(data):
     # 1. RECONNECT LOGIC: Check if this username is already in the game
     existing_sid = None
     for pid, p_info in game.players.items():
-        if p_info['name'] == username:
+        if p_info.name == username and not bots.is_bot(pid):
             existing_sid = pid
             break
             
     if existing_sid:
         # Swap their old broken ID for their new active ID
         game.update_player_sid(existing_sid, sid)
+        if existing_sid in play_again_votes:
+            play_again_votes.remove(existing_sid)
+            play_again_votes.add(sid)
         
         emit('your_id', {'sid': sid}, room=sid)
+        emit('chat_history', {'messages': chat_channel().recent()}, room=sid)
         # Tell the table about the ID swap
-        players_list = [{'sid': pid, 'name': game.players[pid]['name']} for pid in game.turn_order]
-        emit('update_player_list', {'players': players_list}, broadcast=True)
+        emit('update_player_list', player_list_payload(), broadcast=True)
         
         # Send the "care package" to instantly redraw their screen
         state_data = game.get_reconnect_state(sid)
@@ -74,33 +532,31 @@ def handle_join(data):
         broadcast_scores()
         
         # If it was their turn when they closed the tab, pop the UI back up!
-        if game.game_phase == "DECLARING" and game.get_current_bidder_id() == sid:
-            emit('your_turn_to_declare', {}, room=sid)
-        elif game.game_phase == "BIDDING" and game.get_current_bidder_id() == sid:
-            emit('your_turn_to_bid', {'forbidden': game.get_forbidden_bid(sid)}, room=sid)
-        elif game.game_phase == "PLAYING" and game.get_current_bidder_id() == sid:
-            emit('your_turn_to_play', {
-                'is_leader': len(game.current_trick_cards) == 0,
-                'valid_indices': game.get_valid_moves(sid)
-            }, room=sid)
+        prompt = turn_prompt(sid)
+        if prompt: emit(*prompt, room=sid)
+        for prompt in table_prompts(sid): emit(*prompt, room=sid)
+        nudge_bots()
             
         emit('log_message', {'msg': f"🔄 {username} reconnected!"}, broadcast=True)
         return
 
-    # 2. BRAND NEW PLAYER LOGIC 
-    if game.add_player(sid, username):
-        emit('your_id', {'sid': sid}, room=sid)
-        players_list = [{'sid': pid, 'name': game.players[pid]['name']} for pid in game.turn_order]
-        emit('update_player_list', {'players': players_list}, broadcast=True)
+    # 2. BRAND NEW PLAYER LOGIC: Queue in the lobby, lobby_watcher seats them
+    if username.startswith(bots.BOT_NAME_PREFIX):
+        emit('error_message', {'msg': "That name is reserved for bots!"}, room=sid)
+        return
+    if any(entry.name == username for entry in lobby.entries.values()):
+        emit('error_message', {'msg': "That name is already waiting in the lobby!"}, room=sid)
+        return
         
-        if len(players_list) == 4:
-            emit('enable_ready_btn', {}, broadcast=True)
-    else:
-        emit('error_message', {'msg': "Game is already full!"}, room=sid)
+    lobby.join(sid, username, leaderboard.rating(username))
+    emit('log_message', {'msg': f"⏳ {table_status()} You are #{lobby.position(sid)} in the queue."}, room=sid)
+    emit('lobby_ping', {'t': time.time() * 1000}, room=sid)
 
 # --- READY & ACE HUNT ---
 @socketio.on('player_ready')
+@table_event
 def handle_ready():
+    if request.sid not in game.players: return # Queued players can see the button too
     if game.mark_ready(request.sid):
         emit('log_message', {'msg': "All Ready! Hunting for Ace..."}, broadcast=True)
         sequence = game.perform_ace_hunt()
@@ -108,6 +564,7 @@ def handle_ready():
 
 # --- START ROUND ---
 @socketio.on('start_real_round')
+@table_event
 def handle_start_round():
     if game.game_phase == "BIDDING": return
     
@@ -120,13 +577,13 @@ def handle_start_round():
     # CASE A: SPECIAL 9-CARD ROUND (DECLARATION)
     if phase_status == "DECLARING":
         leader_sid = game.get_current_bidder_id()
-        leader_name = game.players[leader_sid]['name']
+        leader_name = game.players[leader_sid].name
         
         emit('log_message', {'msg': f"Round {game.round_number}. {leader_name} is declaring!"}, broadcast=True)
         
         # 1. Show the Leader their 3 cards so they can decide
         emit('new_round', {
-            'hand': game.players[leader_sid]['hand'],
+            'hand': game.players[leader_sid].hand,
             'trump': {'rank': '?', 'suit': '?', 'value': '??'}, # Hidden for now
             'round_number': game.round_number,
             'max_bid': 9
@@ -150,13 +607,13 @@ def handle_start_round():
     first_bidder_sid = game.get_current_bidder_id()
     for pid in game.players:
         emit('new_round', {
-            'hand': game.players[pid]['hand'],
+            'hand': game.players[pid].hand,
             'trump': game.trump_card,
             'round_number': game.round_number,
             'max_bid': game.cards_to_deal
         }, room=pid)
     
-    bidder_name = game.players[first_bidder_sid]['name']
+    bidder_name = game.players[first_bidder_sid].name
     emit('your_turn_to_bid', {'forbidden': game.get_forbidden_bid(first_bidder_sid)}, room=first_bidder_sid)
     
     # ---> ADDED: Tell everyone WHO is bidding! <---
@@ -166,6 +623,7 @@ def handle_start_round():
 
 # --- NEW: HANDLE DECLARATION RESPONSE ---
 @socketio.on('declare_trump')
+@table_event
 def handle_declaration(data):
     suit = data['suit']
     # 1. Update Engine (Set Trump, Deal remaining cards)
@@ -178,7 +636,7 @@ def handle_declaration(data):
     # 3. Refresh everyone's screen with full hands
     for pid in game.players:
         emit('new_round', {
-            'hand': game.players[pid]['hand'],
+            'hand': game.players[pid].hand,
             'trump': game.trump_card, 
             'round_number': game.round_number,
             'max_bid': 9
@@ -186,7 +644,7 @@ def handle_declaration(data):
         
     # 4. Start Bidding normally
     first_bidder_sid = game.get_current_bidder_id()
-    first_bidder_name = game.players[first_bidder_sid]['name']
+    first_bidder_name = game.players[first_bidder_sid].name
     
     emit('your_turn_to_bid', {'forbidden': game.get_forbidden_bid(first_bidder_sid)}, room=first_bidder_sid)
     
@@ -195,6 +653,7 @@ def handle_declaration(data):
 
 # --- BIDDING ---
 @socketio.on('player_bid')
+@table_event
 def handle_bid(data):
     amount = int(data['amount'])
     sid = request.sid
@@ -203,7 +662,7 @@ def handle_bid(data):
         emit('error_message', {'msg': result}, room=sid)
         return
 
-    name = game.players[sid]['name']
+    name = game.players[sid].name
     emit('log_message', {'msg': f"{name} bid {amount}"}, broadcast=True)
     
     broadcast_scores() # Show the new bid immediately
@@ -212,7 +671,7 @@ def handle_bid(data):
         emit('log_message', {'msg': "Bids closed! Game On!"}, broadcast=True)
         
         first_player_sid = game.get_current_bidder_id()
-        first_name = game.players[first_player_sid]['name']
+        first_name = game.players[first_player_sid].name
         emit('update_turn_indicator', {'sid': first_player_sid, 'name': first_name}, broadcast=True)
         
         # ---> THE FIX: Include valid_indices so the first player can actually click a card! <---
@@ -222,7 +681,7 @@ def handle_bid(data):
         }, room=first_player_sid)
     else:
         next_sid = game.get_current_bidder_id()
-        next_name = game.players[next_sid]['name']
+        next_name = game.players[next_sid].name
         
         emit('your_turn_to_bid', {'forbidden': game.get_forbidden_bid(next_sid)}, room=next_sid)
         
@@ -231,6 +690,7 @@ def handle_bid(data):
 
 # --- PLAYING CARDS ---
 @socketio.on('play_card')
+@table_event
 def handle_play_card(data):
     sid = request.sid
     card_index = data.get('card_index') 
@@ -248,11 +708,11 @@ def handle_play_card(data):
         return
         
     emit('card_played_on_table', {'sid': sid, 'card': result}, broadcast=True)
-    emit('hand_update', {'hand': game.players[sid]['hand']}, room=sid)
+    emit('hand_update', {'hand': game.players[sid].hand}, room=sid)
 
     # --- JOKER ANNOUNCEMENT BLOCK ---
     if result.get('rank') == 'Joker':
-        player_name = game.players[sid]['name']
+        player_name = game.players[sid].name
         if joker_action:
             action_word = "WANTS TO TAKE" if joker_action == "TAKE" else "WANTS TO GIVE"
             suit_word = joker_suit
@@ -312,7 +772,7 @@ def handle_play_card(data):
             }, room=winner['sid'])
     else:
         next_sid = game.get_current_bidder_id()
-        next_name = game.players[next_sid]['name']
+        next_name = game.players[next_sid].name
         emit('update_turn_indicator', {'sid': next_sid, 'name': next_name}, broadcast=True)
         emit('your_turn_to_play', {
             'is_leader': False, 
@@ -323,11 +783,14 @@ def handle_play_card(data):
 # --- WAITING FOR PLAYERS TO CLOSE SCOREBOARD ---
 # --- WAITING FOR PLAYERS TO CLOSE SCOREBOARD ---
 @socketio.on('ready_next_round')
+@table_event
 def handle_ready_next_round():
     sid = request.sid
+    # Late or repeated clicks (resent scoreboards) must not count towards the next round
+    if sid not in game.players or not game.awaiting_next_round() or sid in game.ready_for_next_round: return
     game.ready_for_next_round.add(sid)
     
-    player_name = game.players[sid]['name']
+    player_name = game.players[sid].name
     emit('log_message', {'msg': f"✔️ {player_name} is ready."}, broadcast=True)
     
     # If all players have clicked ready, check what to do next!
@@ -339,28 +802,35 @@ def handle_ready_next_round():
 
         # ---> THE NEW GAME OVER & TIE BREAKER LOGIC <---
         if phase_status == "GAME_OVER":
-            ranked_players = sorted(game.players.values(), key=lambda p: p['score'], reverse=True)
-            highest_score = ranked_players[0]['score']
+            archive_finished_game()
+            rating_changes = leaderboard.record_game({p.name: p.score for sid, p in game.players.items() if not bots.is_bot(sid)})
+            
+            ranked_players = sorted(game.players.values(), key=lambda p: p.score, reverse=True)
+            highest_score = ranked_players[0].score
             
             # Find everyone who tied for 1st place
-            winners = [p for p in ranked_players if p['score'] == highest_score]
-            runners_up = [p for p in ranked_players if p['score'] < highest_score]
+            winners = [p for p in ranked_players if p.score == highest_score]
+            runners_up = [p for p in ranked_players if p.score < highest_score]
             
             emit('log_message', {'msg': "🏆 ----------------------- 🏆"}, broadcast=True)
             emit('log_message', {'msg': "GAME OVER! Final Results:"}, broadcast=True)
             
             winner_names = []
             for w in winners:
-                emit('log_message', {'msg': f"🥇 1st Place: {w['name']} ({w['score']} pts)"}, broadcast=True)
-                winner_names.append(w['name'])
+                emit('log_message', {'msg': f"🥇 1st Place: {w.name} ({w.score} pts)"}, broadcast=True)
+                winner_names.append(w.name)
                 
             medals = ["🥈 2nd Place", "🥉 3rd Place", "💀 4th Place"]
             for i, p in enumerate(runners_up):
                 medal = medals[i] if i < len(medals) else "💀 4th Place"
-                emit('log_message', {'msg': f"{medal}: {p['name']} ({p['score']} pts)"}, broadcast=True)
+                emit('log_message', {'msg': f"{medal}: {p.name} ({p.score} pts)"}, broadcast=True)
                 
             emit('log_message', {'msg': "🏆 ----------------------- 🏆"}, broadcast=True)
             
+            for name, (before, after) in rating_changes.items():
+                arrow = "📈" if after >= before else "📉"
+                emit('log_message', {'msg': f"{arrow} {name}: {round(before)} → {round(after)}"}, broadcast=True)
+            
             # Send the LIST of winners to the frontend
             emit('game_over_event', {
                 'winner_names': winner_names
@@ -368,10 +838,10 @@ def handle_ready_next_round():
 
         elif phase_status == "DECLARING":
             leader_sid = game.get_current_bidder_id()
-            leader_name = game.players[leader_sid]['name']
+            leader_name = game.players[leader_sid].name
             
             emit('new_round', {
-                'hand': game.players[leader_sid]['hand'],
+                'hand': game.players[leader_sid].hand,
                 'trump': {'rank': '?', 'suit': '?', 'value': '??'},
                 'round_number': game.round_number,
                 'max_bid': 9
@@ -381,11 +851,11 @@ def handle_ready_next_round():
             
         else:
             first_bidder_sid = game.get_current_bidder_id()
-            first_bidder_name = game.players[first_bidder_sid]['name']
+            first_bidder_name = game.players[first_bidder_sid].name
             
             for pid in game.players:
                 emit('new_round', {
-                    'hand': game.players[pid]['hand'],
+                    'hand': game.players[pid].hand,
                     'trump': game.trump_card,
                     'round_number': game.round_number,
                     'max_bid': game.cards_to_deal
@@ -395,18 +865,19 @@ def handle_ready_next_round():
             emit('update_turn_indicator', {'sid': first_bidder_sid, 'name': first_bidder_name}, broadcast=True)
 
 @socketio.on('play_again_vote')
+@table_event
 def handle_play_again():
     global game  # <--- Moved to the very top!
     
     sid = request.sid
     play_again_votes.add(sid)
     
-    name = game.players.get(sid, {}).get('name', 'Player')
+    name = game.players[sid].name if sid in game.players else 'Player'
     emit('log_message', {'msg': f"🔄 {name} voted to Play Again!"}, broadcast=True)
     
     # If all 4 players click the button...
     if len(play_again_votes) >= len(game.players):
-        game = JokerGame() # Completely wipes the server's game engine clean!
+        game = new_table() # Completely wipes the server's game engine clean!
         play_again_votes.clear()
         
         emit('log_message', {'msg': "Restarting game..."}, broadcast=True)
@@ -416,16 +887,24 @@ def handle_play_again():
         emit('force_reload', {}, broadcast=True)
 
 @socketio.on('send_chat')
+@table_event
 def handle_chat(data):
-    nickname = data.get('nickname', 'Player')
-    message = data.get('message', '')
+    sid = request.sid
+    # Never trust a name from the browser: only seated players can talk
+    if sid not in game.players:
+        emit('chat_error', {'msg': "Join the table to chat!"}, room=sid)
+        return
     
-    if message:
-        emit('receive_chat', {'nickname': nickname, 'message': message}, broadcast=True)
+    error = chat_channel().post(game.players[sid].name, data.get('message', ''))
+    if error:
+        emit('chat_error', {'msg': error}, room=sid)
 
 if __name__ == '__main__':
     print("=========================================")
     print("🃏 JOKER SERVER IS STARTING...")
     print("🌍 Play locally at: http://localhost:7860")
     print("=========================================")
+    signal.signal(signal.SIGTERM, handle_shutdown)
+    socketio.start_background_task(idle_watcher)
+    socketio.start_background_task(lobby_watcher)
     socketio.run(app, host='0.0.0.0', port=7860, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""Server-side bots that fill empty seats when the lobby gives up waiting.
+
+A bot only looks at what a player could see: its own hand, the trump and
+the cards already on the table. It plays a plain game - bid about one trick
+per strong card, try to win while it still needs tricks, throw its lowest
+card once it has enough.
+"""
+BOT_SID_PREFIX = 'bot-'
+BOT_NAME_PREFIX = '🤖'
+THINK_SECONDS = 1.0  # Pause before a bot acts, so humans can follow the table
+
+def is_bot(sid):
+    return isinstance(sid, str) and sid.startswith(BOT_SID_PREFIX)
+
+def bot_identity(table_id, number):
+    # The sid names the table too, so a prompt left over from an old table
+    # can never be answered at the next one
+    return f"{BOT_SID_PREFIX}{table_id}-{number}", f"{BOT_NAME_PREFIX} Bot {number}"
+
+def _strength(game, card):
+    rank_value = game.get_rank_value(card['rank'])
+    if card['suit'] == game.trump_suit: rank_value += 10
+    return rank_value
+
+def _is_strong(game, card):
+    if card['rank'] in ('Joker', 'A'): return True
+    return card['suit'] == game.trump_suit and card['rank'] in ('K', 'Q')
+
+# --- DECISIONS ---
+def choose_trump(hand):
+    # The suit we hold most of among the first three cards, or no trump
+    counts = {}
+    for card in hand:
+        if card['rank'] != 'Joker': counts[card['suit']] = counts.get(card['suit'], 0) + 1
+    if not counts or max(counts.values()) < 2: return 'NT'
+    return max(counts, key=counts.get)
+
+def choose_bid(game, sid, forbidden):
+    hand = game.players[sid].hand
+    bid = min(sum(1 for card in hand if _is_strong(game, card)), game.cards_to_deal)
+    if bid == forbidden:
+        bid = bid + 1 if bid < game.cards_to_deal else bid - 1
+    return bid
+
+def choose_play(game, sid, valid_indices):
+    # Returns (card_index, joker_action, joker_suit)
+    hand = game.players[sid].hand
+    wants_tricks = game.tricks_won.get(sid, 0) < game.bids.get(sid, 0)
+    is_leader = not game.current_trick_cards
+
+    jokers = [i for i in valid_indices if hand[i]['rank'] == 'Joker']
+    others = sorted((i for i in valid_indices if hand[i]['rank'] != 'Joker'), key=lambda i: _strength(game, hand[i]))
+
+    if wants_tricks and jokers:
+        return jokers[0], 'TAKE', 'TRUMP'
+    if others:
+        return (others[-1] if wants_tricks else others[0]), None, None
+    return jokers[0], 'GIVE', ('LEAD' if not is_leader else 'TRUMP')
@@ -0,0 +1,68 @@
+"""Table chat: server-side identity, rate limiting and batched delivery.
+
+* Who said it comes from the seat the sid is sitting in, never from the
+  browser, so nobody can post under someone else's name.
+* Each player has a token bucket (a short burst, then a steady trickle).
+* Messages arriving within a short window go out together as a single
+  'receive_chat_batch' frame, so a busy chat costs one frame per window
+  instead of one per message.
+* The last few messages are kept so reconnecting players can catch up.
+"""
+import html
+import time
+from collections import deque
+
+MAX_MESSAGE_LENGTH = 300
+HISTORY_SIZE = 50
+BATCH_WINDOW_SECONDS = 0.2
+RATE_PER_SECOND = 1.0
+BURST = 5
+
+
+class TokenBucket:
+    def __init__(self, rate=RATE_PER_SECOND, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1: return False
+        self.tokens -= 1
+        return True
+
+
+class ChatChannel:
+    def __init__(self, socketio, deliver, history_size=HISTORY_SIZE, window=BATCH_WINDOW_SECONDS):
+        self.socketio = socketio
+        self.deliver = deliver  # (messages) -> sends one batch frame to the whole table
+        self.window = window
+        self.history = deque(maxlen=history_size)
+        self.pending = []
+        self.buckets = {}  # sender name -> TokenBucket (survives reconnects)
+
+    def post(self, name, text):
+        # Returns an error string for the sender, or None if the message was accepted
+        text = (text or '').strip()[:MAX_MESSAGE_LENGTH]
+        if not text: return None
+
+        bucket = self.buckets.setdefault(name, TokenBucket())
+        if not bucket.take(): return "Slow down! You are sending messages too fast."
+
+        message = {'nickname': html.escape(name), 'message': html.escape(text), 'time': time.time()}
+        self.history.append(message)
+        self.pending.append(message)
+        if len(self.pending) == 1:
+            self.socketio.start_background_task(self._flush_later)
+        return None
+
+    def _flush_later(self):
+        self.socketio.sleep(self.window)
+        batch, self.pending = self.pending, []
+        if batch: self.deliver(batch)
+
+    def recent(self):
+        return list(self.history)
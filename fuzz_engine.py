@@ -0,0 +1,311 @@
+"""Differential fuzzer: prove a candidate rules engine behaves like JokerGame.
+
+Usage:
+    python fuzz_engine.py --candidate my_fast_engine:FastJokerGame --games 100000
+    python fuzz_engine.py --replay reproducer.json --candidate ...
+
+Each seeded game is driven through the reference engine with a random mix of
+legal and illegal actions (out-of-turn plays, forbidden bids, bad indices,
+cards that break suit rules). It covers every round_schedule size and both
+declared and dealt trumps, including NT. The same action list is then replayed
+on the candidate, and every return value plus a snapshot of the table is
+compared step by step.
+
+On the first divergence the action list is shrunk (a prefix up to the failing
+step, with rejected actions removed where they are not needed) and written out
+as a JSON reproducer that --replay can run again.
+
+If the reference engine itself raises, that is a server bug too: the game is
+cut short there, shrunk the same way and written to --crash-out, and the run
+is not reported as clean.
+"""
+import argparse
+import importlib
+import json
+import random
+import sys
+from multiprocessing import Pool
+
+from game_engine import JokerGame
+
+SEATS = ['s0', 's1', 's2', 's3']
+SUITS = ['H', 'D', 'C', 'S']
+JOKER_SUITS = ['TRUMP', 'LEAD', 'H', 'D', 'C', 'S']
+
+
+def load_engine(path):
+    module_name, _, class_name = path.partition(':')
+    return getattr(importlib.import_module(module_name), class_name or 'JokerGame')
+
+
+# --- WHAT WE COMPARE AFTER EVERY STEP ---
+def snapshot(game):
+    current = game.get_current_bidder_id()
+    return {
+        'game_phase': game.game_phase,
+        'round_number': game.round_number,
+        'trump_suit': game.trump_suit,
+        'trump_card': game.trump_card,
+        'bids': game.bids,
+        'tricks_won': game.tricks_won,
+        'premia_eligible': game.premia_eligible,
+        'current_bidder': current,
+        'current_trick': game.current_trick_cards,
+        'hands': {sid: game.players[sid].hand for sid in game.turn_order},
+        'scores': {sid: game.players[sid].score for sid in game.turn_order},
+        'score_history': game.history_payload(),
+        'valid_moves': game.get_valid_moves(current) if game.game_phase == "PLAYING" else None,
+    }
+
+
+def normalize(value):
+    # JSON round trip: tuples vs lists and int/str keys all compare the same way
+    return json.loads(json.dumps(value, sort_keys=True, default=sorted))
+
+
+def same(want, got):
+    # Observations point at live engine state, so compare them straight away.
+    # The cheap == settles almost every step; normalize only on a mismatch.
+    return want == got or normalize(want) == normalize(got)
+
+
+# --- APPLYING ONE ACTION TO AN ENGINE ---
+def apply_action(game, action):
+    kind = action[0]
+    if kind == 'setup':
+        game.seed = action[1] # Same table seed: same ace hunt and same deals
+        for i, sid in enumerate(SEATS):
+            game.add_player(sid, f"P{i}")
+            game.mark_ready(sid)
+        return game.perform_ace_hunt()
+    if kind == 'start_round':
+        return game.start_new_round()
+    if kind == 'declare':
+        return game.set_trump_and_deal(action[1])
+    if kind == 'bid':
+        return game.process_bid(action[1], action[2])
+    if kind == 'play':
+        _, sid, index, joker_action, joker_suit = action
+        joker_data = {'joker_action': joker_action, 'joker_suit': joker_suit} if joker_action else None
+        return game.play_card(sid, index, joker_data)
+    if kind == 'trick_end':
+        return game.check_trick_end()
+    if kind == 'score':
+        return game.calculate_round_scores()
+    raise ValueError(f"Unknown action {action!r}")
+
+
+def observe(game, action):
+    try:
+        result = apply_action(game, action)
+    except Exception as e:
+        result = {'exception': type(e).__name__}
+    return {'result': result, 'state': snapshot(game)}
+
+
+# --- RANDOM ACTION GENERATION (driven by the reference engine) ---
+def random_play(rng, game, illegal_rate):
+    sid = game.get_current_bidder_id()
+    hand = game.players[sid].hand
+    valid = game.get_valid_moves(sid)
+
+    if rng.random() < illegal_rate:
+        roll = rng.random()
+        if roll < 0.3:
+            sid = rng.choice([s for s in SEATS if s != sid])
+            index = rng.randrange(max(1, len(game.players[sid].hand)))
+        elif roll < 0.5:
+            index = rng.choice([len(hand), len(hand) + 3])
+        else:
+            invalid = [i for i in range(len(hand)) if i not in valid]
+            index = rng.choice(invalid) if invalid else rng.choice(valid)
+    else:
+        index = rng.choice(valid)
+
+    card = game.players[sid].hand[index] if index < len(game.players[sid].hand) else None
+    if card and card['rank'] == 'Joker' and rng.random() < 0.9:
+        return ('play', sid, index, rng.choice(['TAKE', 'GIVE']), rng.choice(JOKER_SUITS))
+    return ('play', sid, index, None, None)
+
+
+def random_bid(rng, game, illegal_rate):
+    sid = game.get_current_bidder_id()
+    forbidden = game.get_forbidden_bid(sid)
+    if rng.random() < illegal_rate:
+        if forbidden is not None and rng.random() < 0.5:
+            return ('bid', sid, forbidden)
+        return ('bid', rng.choice([s for s in SEATS if s != sid]), rng.randint(0, game.cards_to_deal))
+    amount = rng.randint(0, game.cards_to_deal)
+    if amount == forbidden: amount = (amount + 1) % (game.cards_to_deal + 1)
+    return ('bid', sid, amount)
+
+
+def generate_game(seed, illegal_rate=0.2):
+    # Yields (action, reference observation) pairs for one full game
+    rng = random.Random(seed)
+    game = JokerGame()
+
+    def step(action):
+        return action, observe(game, action)
+
+    yield step(('setup', rng.getrandbits(32)))
+    while True:
+        action, seen = step(('start_round',))
+        yield action, seen
+        if seen['result'] == "GAME_OVER": return
+
+        if game.game_phase == "DECLARING":
+            yield step(('declare', rng.choice(SUITS + ['NT'])))
+        while game.game_phase == "BIDDING":
+            yield step(random_bid(rng, game, illegal_rate))
+        while game.game_phase == "PLAYING":
+            yield step(random_play(rng, game, illegal_rate))
+            if len(game.current_trick_cards) == 4:
+                action, seen = step(('trick_end',))
+                yield action, seen
+                if isinstance(seen['result'], dict) and 'exception' in seen['result']: return # Reference blew up: nothing sane follows
+                if seen['result']['round_over']:
+                    yield step(('score',))
+                    break
+
+
+# --- COMPARISON, SHRINKING AND REPORTING ---
+def first_divergence(candidate_cls, actions):
+    reference = JokerGame()
+    candidate = candidate_cls()
+    for i, action in enumerate(actions):
+        want = observe(reference, action)
+        got = observe(candidate, action)
+        if not same(want, got):
+            return i, normalize(want), normalize(got)
+    return None
+
+
+def first_crash(actions):
+    # Step at which the reference engine itself raises, if any
+    reference = JokerGame()
+    for i, action in enumerate(actions):
+        seen = observe(reference, action)
+        if isinstance(seen['result'], dict) and 'exception' in seen['result']:
+            return i, normalize(seen), None
+    return None
+
+
+def is_rejected(action, seen):
+    # An action the reference refused outright (and that changed nothing)
+    result = seen['result']
+    return action[0] in ('bid', 'play') and isinstance(result, (list, tuple)) and result[0] is False
+
+
+def shrink(find, actions, rejected):
+    # find(actions) -> (step, ...) of the first failure, or None.
+    # Cut after the failing step, then drop every rejected action we can live without
+    fail_at = find(actions)[0]
+    actions, rejected = actions[:fail_at + 1], rejected[:fail_at + 1]
+
+    i = len(actions) - 2  # Walk backwards so earlier indices stay put
+    while i >= 0:
+        if rejected[i]:
+            trial = actions[:i] + actions[i + 1:]
+            found = find(trial)
+            if found is not None:
+                cut = found[0] + 1
+                actions = trial[:cut]
+                rejected = (rejected[:i] + rejected[i + 1:])[:cut]
+                i = min(i, len(actions) - 1)
+        i -= 1
+    return actions
+
+
+def report_for(kind, seed, find, actions, rejected):
+    minimal = shrink(find, actions, rejected)
+    step, want, got = find(minimal)
+    return {
+        'kind': kind,
+        'seed': seed,
+        'step': step,
+        'action': minimal[step],
+        'actions': minimal,
+        'reference': want,
+        'candidate': got,
+    }
+
+
+def check_seed(args):
+    seed, candidate_path, illegal_rate = args
+    candidate_cls = load_engine(candidate_path)
+    candidate = candidate_cls()
+    actions, rejected = [], []
+
+    for action, want in generate_game(seed, illegal_rate):
+        actions.append(action)
+        rejected.append(is_rejected(action, want))
+        got = observe(candidate, action)
+        if not same(want, got):
+            find = lambda trial: first_divergence(candidate_cls, trial)
+            return report_for('divergence', seed, find, actions, rejected)
+        # The engines agree, but the reference itself crashed: a real server bug
+        if isinstance(want['result'], dict) and 'exception' in want['result']:
+            return report_for('crash', seed, first_crash, actions, rejected)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Differential fuzzing of a Joker rules engine against JokerGame.")
+    parser.add_argument('--candidate', default='game_engine:JokerGame', help="module:Class of the engine under test")
+    parser.add_argument('--games', type=int, default=1000, help="Number of seeded games to play")
+    parser.add_argument('--seed', type=int, default=0, help="First game seed")
+    parser.add_argument('--illegal-rate', type=float, default=0.2, help="Share of deliberately illegal actions")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--out', default='reproducer.json', help="Where to write the minimized reproducer")
+    parser.add_argument('--crash-out', default='crash_reproducer.json', help="Where to write the first reference crash")
+    parser.add_argument('--replay', help="Re-run a reproducer file instead of fuzzing")
+    args = parser.parse_args(argv)
+
+    candidate_cls = load_engine(args.candidate)
+
+    if args.replay:
+        with open(args.replay) as f:
+            report = json.load(f)
+        actions = [tuple(a) for a in report['actions']]
+        if report.get('kind') == 'crash':
+            found = first_crash(actions)
+            print("Reference still crashes at step", found[0]) if found else print("No crash, reference runs clean.")
+        else:
+            found = first_divergence(candidate_cls, actions)
+            print("Still diverges at step", found[0]) if found else print("No divergence, engines agree.")
+        return 1 if found else 0
+
+    crashes = []
+    jobs = ((seed, args.candidate, args.illegal_rate) for seed in range(args.seed, args.seed + args.games))
+    with Pool(args.workers) as pool:
+        for checked, report in enumerate(pool.imap(check_seed, jobs, chunksize=8), start=1):
+            if report and report['kind'] == 'divergence':
+                pool.terminate()
+                with open(args.out, 'w') as f:
+                    json.dump(report, f, indent=2)
+                print(f"❌ Divergence in game seed {report['seed']} at step {report['step']}: {report['action']}")
+                print(f"   Minimized reproducer ({len(report['actions'])} actions) written to {args.out}")
+                return 1
+            if report:
+                # Keep fuzzing for divergences, but never call these games clean
+                if not crashes:
+                    with open(args.crash_out, 'w') as f:
+                        json.dump(report, f, indent=2)
+                crashes.append(report)
+                print(f"💥 Reference crashed in game seed {report['seed']} at step {report['step']}: "
+                      f"{report['action']} -> {report['reference']['result']['exception']}")
+            if checked % 1000 == 0:
+                print(f"... {checked} games checked")
+
+    if crashes:
+        print(f"⚠️  {args.games} games, no divergence, but the reference crashed in {len(crashes)} "
+              f"(cut short, not checked past the crash).")
+        print(f"   First crash, minimized to {len(crashes[0]['actions'])} actions, written to {args.crash_out}")
+        return 1
+    print(f"✅ {args.games} games, no divergence.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,73 @@
 import random
+import sys
+import uuid
+from array import array
+
+# --- THE 36 CARDS: Built once and shared by every table ---
+# Hands and decks only hold references to these dicts, so they must never be
+# modified in place. Anything that annotates a card (play_card, a Joker trump)
+# works on a copy.
+def _build_cards():
+    cards = []
+    for s in ['H', 'D', 'C', 'S']:
+        for r in ['7', '8', '9', '10', 'J', 'Q', 'K', 'A']:
+            cards.append({"rank": r, "suit": s, "value": f"{r}{s}"})
+    cards.append({"rank": "6", "suit": "H", "value": "6H"})
+    cards.append({"rank": "6", "suit": "D", "value": "6D"})
+    return tuple(cards)
+
+DECK_WITHOUT_JOKERS = _build_cards()
+DECK_WITH_JOKERS = DECK_WITHOUT_JOKERS + (
+    {"rank": "Joker", "suit": "Red", "value": "JKR"},
+    {"rank": "Joker", "suit": "Black", "value": "JKB"},
+)
+CARDS_BY_VALUE = {card['value']: card for card in DECK_WITH_JOKERS}
+SHARED_CARD_IDS = frozenset(id(card) for card in DECK_WITH_JOKERS)
+
+def shuffled_deck(seed, round_key, with_jokers=True):
+    # One permutation of the shared cards, fully determined by (seed, round_key).
+    # round_key is the round index, or "ace_hunt" for the dealer draw.
+    deck = DECK_WITH_JOKERS if with_jokers else DECK_WITHOUT_JOKERS
+    return random.Random(f"{seed}:{round_key}").sample(deck, len(deck))
+
+def intern_card(card):
+    # Swap a plain (un-played) card dict for its shared twin
+    shared = CARDS_BY_VALUE.get(card.get('value'))
+    return shared if shared == card else card
+
+# --- HISTORY: One fixed-width row per finished round ---
+# score_history[i] is an int array with HISTORY_WIDTH slots per seat (in
+# turn_order), round_log[i] a (trump_suit, dealer_index, jokers) tuple with
+# one (seat, action, led, won) tuple per Joker played. Seats never move, so
+# a reconnect (new sid) doesn't touch history. The dicts the scoreboard and
+# the archive want are built when they are sent.
+HISTORY_WIDTH = 4   # bid, won, points_earned, flags
+PREMIA, DELETED, DOUBLED = 1, 2, 4
+
+class Player:
+    __slots__ = ['name', 'score', 'hand']
+
+    def __init__(self, name, score=0, hand=None):
+        self.name = name
+        self.score = score
+        self.hand = hand if hand is not None else []
+
+    def to_state(self):
+        return {'name': self.name, 'score': self.score, 'hand': self.hand}
 
 class JokerGame:
-    def __init__(self):
+    __slots__ = [
+        'players', 'bids', 'tricks_won', 'ready_players',
+        'deck', 'trump_card', 'trump_suit',
+        'game_phase', 'turn_order', 'premia_eligible', 'current_phase_scores',
+        'score_history', 'ready_for_next_round',
+        'round_schedule', 'current_round_index', 'round_number', 'cards_to_deal',
+        'dealer_index', 'current_bidder_index', 'current_trick_cards',
+        'lead_override_suit', 'tricks_played_in_round',
+        'game_id', 'round_log', 'round_jokers', 'seed',
+    ]
+
+    def __init__(self, seed=None):
         self.players = {}       
         self.bids = {}          
         self.tricks_won = {}    
@@ -28,6 +94,15 @@ class JokerGame:
         self.current_bidder_index = 0
         self.current_trick_cards = []
         self.lead_override_suit = None
+        self.tricks_played_in_round = 0
+
+        # --- RECORDING: What the archive / analytics need after the game ---
+        self.game_id = uuid.uuid4().hex[:12]
+        
+        # --- DEALING: Every deal of this table comes from (seed, round) ---
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(64)
+        self.round_log = []       # One summary per finished round
+        self.round_jokers = []    # Joker plays of the round in progress
 
     def update_player_sid(self, old_sid, new_sid):
         # 1. Swap in main dictionaries
@@ -52,27 +127,81 @@ class JokerGame:
             self.ready_for_next_round.remove(old_sid)
             self.ready_for_next_round.add(new_sid)
             
-        # 4. Swap in history book
-        for entry in self.score_history:
-            if old_sid in entry:
-                entry[new_sid] = entry.pop(old_sid)
-                
-        # 5. Swap any cards currently lying on the table
+        # 4. Swap any cards currently lying on the table
+        # (score_history and the Joker log go by seat, nothing to swap there)
         for trick_play in self.current_trick_cards:
             if trick_play['sid'] == old_sid:
                 trick_play['sid'] = new_sid
 
+    def awaiting_next_round(self):
+        # Round is scored, the table is waiting for everyone to close the scoreboard
+        return self.game_phase == "PLAYING" and len(self.score_history) == self.current_round_index + 1
+
     def get_reconnect_state(self, sid):
         # Package everything the frontend needs to instantly redraw the game
         return {
             'game_phase': self.game_phase,
-            'hand': self.players.get(sid, {}).get('hand', []),
+            'hand': self.players[sid].hand if sid in self.players else [],
             'trump_card': self.trump_card,
             'current_trick': self.current_trick_cards,
             'current_bidder_sid': self.get_current_bidder_id(),
             'my_valid_indices': self.get_valid_moves(sid) if self.get_current_bidder_id() == sid else []
         }
 
+    # --- HANDOFF: Freeze the whole table into plain JSON and back ---
+    STATE_FIELDS = __slots__ # Every attribute of the table travels in the handoff
+    SET_FIELDS = ['ready_players', 'ready_for_next_round']
+
+    def to_state(self):
+        state = {}
+        for field in self.STATE_FIELDS:
+            value = getattr(self, field, None)
+            if field in self.SET_FIELDS: value = sorted(value)
+            state[field] = value
+        state['players'] = {sid: player.to_state() for sid, player in self.players.items()}
+        state['score_history'] = [row.tolist() for row in self.score_history]
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        game = cls()
+        for field in cls.STATE_FIELDS:
+            if field not in state: continue
+            value = state[field]
+            if field in cls.SET_FIELDS: value = set(value)
+            setattr(game, field, value)
+        # JSON gave us fresh copies: point hands and deck back at the shared cards
+        game.deck = [intern_card(c) for c in game.deck]
+        game.players = {
+            sid: Player(p['name'], p['score'], [intern_card(c) for c in p['hand']])
+            for sid, p in game.players.items()
+        }
+        # ... and lists back into history rows
+        game.score_history = [array('i', row) for row in game.score_history]
+        game.round_log = [(trump, dealer, tuple(tuple(j) for j in jokers)) for trump, dealer, jokers in game.round_log]
+        game.round_jokers = [tuple(j) for j in game.round_jokers]
+        return game
+
+    def memory_footprint(self):
+        # Rough bytes held by this table. The shared cards are not counted,
+        # they cost the same whether there is one table or ten thousand.
+        seen = set(SHARED_CARD_IDS)
+        total = sys.getsizeof(self)
+        stack = [getattr(self, field) for field in self.__slots__]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen: continue
+            seen.add(id(obj))
+            total += sys.getsizeof(obj)
+            if isinstance(obj, dict):
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            elif isinstance(obj, (list, tuple, set, frozenset)):
+                stack.extend(obj)
+            elif isinstance(obj, Player):
+                stack.extend(getattr(obj, field) for field in Player.__slots__)
+        return total
+
     def add_player(self, sid, name):
         # 1. The Bouncer: Stop if the table is already full!
         if len(self.turn_order) >= 4:
@@ -81,11 +210,11 @@ class JokerGame:
         # 2. THE FIX: Stop if this exact name is ALREADY sitting at the table!
         # This prevents the double-login bug if the browser glitches and sends two requests.
         for existing_player in self.players.values():
-            if existing_player['name'] == name:
+            if existing_player.name == name:
                 return False 
                 
         # 3. If they pass the checks, give them a seat!
-        self.players[sid] = {'name': name, 'score': 0, 'hand': []}
+        self.players[sid] = Player(name)
         self.turn_order.append(sid)
         return True
 
@@ -95,34 +224,26 @@ class JokerGame:
             return True
         return False
 
-    def create_deck(self, with_jokers=True):
-        self.deck = []
-        suits = ['H', 'D', 'C', 'S']
-        ranks = ['7', '8', '9', '10', 'J', 'Q', 'K', 'A']
-        for s in suits:
-            for r in ranks:
-                self.deck.append({"rank": r, "suit": s, "value": f"{r}{s}"})
-        self.deck.append({"rank": "6", "suit": "H", "value": "6H"})
-        self.deck.append({"rank": "6", "suit": "D", "value": "6D"})
-        
-        if with_jokers:
-            self.deck.append({"rank": "Joker", "suit": "Red", "value": "JKR"})
-            self.deck.append({"rank": "Joker", "suit": "Black", "value": "JKB"})
-            
-        random.shuffle(self.deck)
+    def create_deck(self, with_jokers=True, round_key=None):
+        if round_key is None: round_key = self.current_round_index
+        self.deck = shuffled_deck(self.seed, round_key, with_jokers)
+
+    def seats_from(self, seat_index):
+        # Table order starting at seat_index (who gets dealt first)
+        return [self.turn_order[(seat_index + i) % 4] for i in range(4)]
 
     def perform_ace_hunt(self):
         # Create deck WITHOUT Jokers
-        self.create_deck(with_jokers=False)
+        self.create_deck(with_jokers=False, round_key="ace_hunt")
         
         ace_hunt_log = []
         found_ace = False
         current_idx = 0
         while not found_ace and self.deck:
-            card = self.deck.pop()
+            card = self.deck.pop(0)
             if not self.turn_order: break 
             sid = self.turn_order[current_idx]
-            name = self.players[sid]['name']
+            name = self.players[sid].name
             is_ace = (card['rank'] == 'A')
             ace_hunt_log.append({'sid': sid, 'name': name, 'card': card, 'is_ace': is_ace})
             if is_ace:
@@ -162,31 +283,32 @@ class JokerGame:
         self.current_trick_cards = []
         self.tricks_played_in_round = 0 
         self.lead_override_suit = None
+        self.round_jokers = []
         
-        for sid in self.players: self.players[sid]["hand"] = []
+        for sid in self.players: self.players[sid].hand = []
 
         if self.cards_to_deal == 9:
             self.game_phase = "DECLARING"
-            hand = []
-            for _ in range(3): hand.append(self.deck.pop())
+            hand = self.deck[:3]
+            self.deck = self.deck[3:] # The other 33 wait for the declaration
             hand.sort(key=lambda x: (x['rank'] == 'Joker', x['suit'], x['rank']))
-            self.players[leader_sid]["hand"] = hand
+            self.players[leader_sid].hand = hand
             return "DECLARING" 
         
         self.game_phase = "BIDDING"
-        for sid in self.players:
-            hand = []
-            for _ in range(self.cards_to_deal):
-                if self.deck: hand.append(self.deck.pop())
+        n = self.cards_to_deal
+        for seat, sid in enumerate(self.seats_from(self.current_bidder_index)):
+            hand = self.deck[seat * n:(seat + 1) * n]
             hand.sort(key=lambda x: (x['rank'] == 'Joker', x['suit'], self.get_rank_value(x['rank'])))
-            self.players[sid]["hand"] = hand
+            self.players[sid].hand = hand
+        self.deck = self.deck[4 * n:]
             
         if self.deck:
-            self.trump_card = self.deck.pop()
+            self.trump_card = self.deck.pop(0)
             self.trump_suit = self.trump_card['suit']
             if self.trump_card['rank'] == 'Joker':
                 self.trump_suit = "NT" 
-                self.trump_card['value'] = "NO TRUMP (Joker)"
+                self.trump_card = dict(self.trump_card, value="NO TRUMP (Joker)")
         else:
             self.trump_card = {"rank": "No", "suit": "Trump", "value": "NT"}
             self.trump_suit = "NT"
@@ -202,17 +324,15 @@ class JokerGame:
             self.trump_card = {"rank": "A", "suit": suit_choice, "value": f"Trump: {suit_choice}"}
 
         leader_sid = self.get_current_bidder_id()
-        for _ in range(6):
-            if self.deck: self.players[leader_sid]["hand"].append(self.deck.pop())
-        self.players[leader_sid]["hand"].sort(key=lambda x: (x['rank'] == 'Joker', x['suit'], self.get_rank_value(x['rank'])))
+        self.players[leader_sid].hand = self.players[leader_sid].hand + self.deck[:6]
+        self.players[leader_sid].hand.sort(key=lambda x: (x['rank'] == 'Joker', x['suit'], self.get_rank_value(x['rank'])))
         
-        for sid in self.players:
-            if sid == leader_sid: continue
-            hand = []
-            for _ in range(9):
-                if self.deck: hand.append(self.deck.pop())
+        # The rest of the table gets 9 each, in seating order after the leader
+        for seat, sid in enumerate(self.seats_from(self.current_bidder_index)[1:]):
+            hand = self.deck[6 + seat * 9:6 + (seat + 1) * 9]
             hand.sort(key=lambda x: (x['rank'] == 'Joker', x['suit'], self.get_rank_value(x['rank'])))
-            self.players[sid]["hand"] = hand
+            self.players[sid].hand = hand
+        self.deck = []
             
         self.game_phase = "BIDDING"
         return True
@@ -258,7 +378,7 @@ class JokerGame:
             lead_suit = lead_card['suit']
 
         played_suit = card_to_play['suit']
-        hand = self.players[sid]['hand']
+        hand = self.players[sid].hand
         cards_of_lead_suit = [c for c in hand if c['suit'] == lead_suit and c['rank'] != 'Joker']
         has_lead_suit = len(cards_of_lead_suit) > 0
         
@@ -295,7 +415,7 @@ class JokerGame:
     
     def get_valid_moves(self, sid):
         valid_indices = []
-        hand = self.players[sid]['hand']
+        hand = self.players[sid].hand
         for i in range(len(hand)):
             # Ask your existing rules engine if this specific card is legal
             valid, _ = self.is_move_valid(sid, hand[i])
@@ -305,14 +425,14 @@ class JokerGame:
 
     def play_card(self, sid, card_index, joker_data=None):
         if sid != self.get_current_bidder_id(): return False, "Not your turn!"
-        hand = self.players[sid]['hand']
+        hand = self.players[sid].hand
         if card_index >= len(hand): return False, "Invalid card"
         
         card_to_play = hand[card_index]
         valid, msg = self.is_move_valid(sid, card_to_play)
         if not valid: return False, msg
         
-        played_card = hand.pop(card_index)
+        played_card = dict(hand.pop(card_index)) # Copy: the shared card stays untouched
         
         if played_card['rank'] == 'Joker' and joker_data:
             action = joker_data.get('joker_action')
@@ -336,7 +456,7 @@ class JokerGame:
             played_card['rank_value'] = self.get_rank_value(played_card['rank'])
             played_card['virtual_suit'] = played_card['suit']
 
-        self.current_trick_cards.append({'sid': sid, 'card': played_card, 'name': self.players[sid]['name']})
+        self.current_trick_cards.append({'sid': sid, 'card': played_card, 'name': self.players[sid].name})
         self.current_bidder_index = (self.current_bidder_index + 1) % 4
         return True, played_card
 
@@ -344,6 +464,16 @@ class JokerGame:
         if len(self.current_trick_cards) == 4:
             winner = self.resolve_winner(self.current_trick_cards)
             self.tricks_won[winner['sid']] += 1
+            
+            # Remember how every Joker TAKE/GIVE worked out
+            for play in self.current_trick_cards:
+                if play['card']['rank'] == 'Joker' and play['card'].get('virtual_action'):
+                    self.round_jokers.append((
+                        self.turn_order.index(play['sid']),
+                        play['card']['virtual_action'],
+                        play is self.current_trick_cards[0],
+                        play['sid'] == winner['sid']
+                    ))
             if not hasattr(self, 'tricks_played_in_round'): self.tricks_played_in_round = 0
             self.tricks_played_in_round += 1
             
@@ -357,7 +487,7 @@ class JokerGame:
 
     def calculate_round_scores(self):
         round_log = {}
-        history_entry = {}
+        history_row = array('i', bytes(4 * HISTORY_WIDTH * len(self.turn_order))) # All zeros
         
         # 1. Calculate standard base scores for this round
         for sid in self.players:
@@ -378,7 +508,7 @@ class JokerGame:
                 self.premia_eligible[sid] = False
                 
             # Apply points to player
-            self.players[sid]['score'] += round_score
+            self.players[sid].score += round_score
             round_log[sid] = round_score
             
             # Save this round's score to the phase history
@@ -386,18 +516,15 @@ class JokerGame:
                 self.current_phase_scores[sid] = []
             self.current_phase_scores[sid].append(round_score)
 
-            # --- NEW: Prepare this round's history entry with DEFAULT flags ---
-            history_entry[sid] = {
-                'bid': bid,
-                'won': won,
-                'points_earned': round_score,
-                'premia': self.premia_eligible.get(sid, True),
-                'is_deleted': False, # <-- Will turn True if deleted by Premia
-                'is_doubled': False  # <-- Will turn True if doubled by Premia
-            }
+            # --- NEW: Prepare this round's history entry (DELETED/DOUBLED flags come later) ---
+            base = self.history_slot(sid)
+            history_row[base:base + HISTORY_WIDTH] = array('i', [
+                bid, won, round_score, PREMIA if self.premia_eligible.get(sid, True) else 0
+            ])
             
         # Add to history BEFORE premia rules, so we can modify the history directly!
-        self.score_history.append(history_entry)
+        self.score_history.append(history_row)
+        self.round_log.append((self.trump_suit, self.dealer_index, tuple(self.round_jokers)))
 
         premia_logs = []
 
@@ -412,13 +539,14 @@ class JokerGame:
             for sid in premia_winners:
                 bonus = round_log[sid]
                 if bonus > 0:
-                    self.players[sid]['score'] += bonus # Add it again to double it
+                    self.players[sid].score += bonus # Add it again to double it
                     
                     # Double it in the UI table and flag it as golden
-                    self.score_history[-1][sid]['points_earned'] *= 2 
-                    self.score_history[-1][sid]['is_doubled'] = True  
+                    base = self.history_slot(sid)
+                    self.score_history[-1][base + 2] *= 2 
+                    self.score_history[-1][base + 3] |= DOUBLED  
                     
-                    name = self.players[sid]['name']
+                    name = self.players[sid].name
                     premia_logs.append(f"⭐ {name} kept Premia! Last round score (+{bonus}) doubled!")
 
             # ADVANTAGE 2: Delete the highest POSITIVE scores of non-premia players
@@ -439,27 +567,77 @@ class JokerGame:
                         target_round_idx = -1
                         
                         # Search the history of this specific phase
+                        base = self.history_slot(target_sid)
                         for i in range(start_idx, len(self.score_history)):
-                            record = self.score_history[i].get(target_sid)
+                            points, flags = self.score_history[i][base + 2:base + 4]
                             # Find highest score that IS NOT already deleted
-                            if record and record['points_earned'] > highest_score and not record['is_deleted']:
-                                highest_score = record['points_earned']
+                            if points > highest_score and not flags & DELETED:
+                                highest_score = points
                                 target_round_idx = i
                                 
                         # If we found a score to delete...
                         if target_round_idx != -1:
                             # Flag it as deleted in the history book for the UI!
-                            self.score_history[target_round_idx][target_sid]['is_deleted'] = True
+                            self.score_history[target_round_idx][base + 3] |= DELETED
                             
                             # Remove the points from their real total
-                            self.players[target_sid]['score'] -= highest_score
+                            self.players[target_sid].score -= highest_score
                             
-                            winner_name = self.players[winner_sid]['name']
-                            target_name = self.players[target_sid]['name']
+                            winner_name = self.players[winner_sid].name
+                            target_name = self.players[target_sid].name
                             premia_logs.append(f"💥 {winner_name}'s Premia deleted {highest_score} points from {target_name}!")
 
         return round_log, premia_logs
 
+    # --- HISTORY ROWS <-> THE DICTS THE BROWSER AND THE ARCHIVE READ ---
+    def history_slot(self, sid):
+        return self.turn_order.index(sid) * HISTORY_WIDTH
+
+    def history_entry(self, row):
+        entry = {}
+        for seat, sid in enumerate(self.turn_order):
+            bid, won, points, flags = row[seat * HISTORY_WIDTH:(seat + 1) * HISTORY_WIDTH]
+            entry[sid] = {
+                'bid': bid,
+                'won': won,
+                'points_earned': points,
+                'premia': bool(flags & PREMIA),
+                'is_deleted': bool(flags & DELETED),
+                'is_doubled': bool(flags & DOUBLED)
+            }
+        return entry
+
+    def history_payload(self):
+        # score_history as the scoreboard expects it: [{sid: {bid, won, ...}}, ...]
+        return [self.history_entry(row) for row in self.score_history]
+
+    def get_archive_record(self):
+        # One self-contained line per finished game for the archive.
+        # Premia flags are only final once the game is over, so the history
+        # entries are merged into the round summaries here and not earlier.
+        rounds = []
+        for round_index, ((trump_suit, dealer_index, jokers), row) in enumerate(zip(self.round_log, self.score_history)):
+            rounds.append({
+                'round_index': round_index,
+                'cards_to_deal': self.round_schedule[round_index],
+                'phase': self.get_current_phase(round_index),
+                'trump_suit': trump_suit,
+                'dealer_index': dealer_index,
+                'jokers': [
+                    {'sid': self.turn_order[seat], 'action': action, 'led': led, 'won': won}
+                    for seat, action, led, won in jokers
+                ],
+                'players': self.history_entry(row)
+            })
+        return {
+            'game_id': self.game_id,
+            'seed': self.seed,
+            'turn_order': self.turn_order,
+            'names': {sid: self.players[sid].name for sid in self.turn_order},
+            'final_scores': {sid: self.players[sid].score for sid in self.turn_order},
+            'rounds': rounds
+        }
+
     def resolve_winner(self, trick):
         first_card = trick[0]['card']
         if first_card['rank'] == 'Joker':
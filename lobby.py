@@ -0,0 +1,137 @@
+"""Matchmaking lobby.
+
+Players who can't sit down straight away wait here. Every tick, groups of
+four are formed from players with close ratings and similar connection
+latency. The longer someone waits, the wider their acceptable rating band and
+latency spread get. Anyone who has waited past the bot timeout gets a table
+anyway, with their closest neighbours plus bots in the empty seats.
+
+Waiting players are kept in a list sorted by rating (bisect), so a tick is a
+single sweep over neighbours instead of comparing every pair.
+"""
+import bisect
+import time
+
+BASE_RATING_BAND = 100       # Max rating spread at a table when nobody has waited
+RATING_BAND_PER_SECOND = 10  # ... widened by this for every second waited
+BASE_LATENCY_SPREAD = 80     # ms, same idea for connection latency
+LATENCY_SPREAD_PER_SECOND = 5
+BOT_BACKFILL_SECONDS = 60    # After this, fill the rest of the table with bots
+TABLE_SIZE = 4
+
+
+class LobbyEntry:
+    __slots__ = ['sid', 'name', 'rating', 'latency', 'joined_at']
+
+    def __init__(self, sid, name, rating, joined_at):
+        self.sid = sid
+        self.name = name
+        self.rating = rating
+        self.latency = None  # ms, filled in once the ping comes back
+        self.joined_at = joined_at
+
+    def key(self):
+        return (self.rating, self.joined_at, self.sid)
+
+    def rating_band(self, now):
+        return BASE_RATING_BAND + RATING_BAND_PER_SECOND * (now - self.joined_at)
+
+    def latency_spread(self, now):
+        return BASE_LATENCY_SPREAD + LATENCY_SPREAD_PER_SECOND * (now - self.joined_at)
+
+
+class Lobby:
+    def __init__(self, bot_backfill_seconds=BOT_BACKFILL_SECONDS):
+        self.bot_backfill_seconds = bot_backfill_seconds
+        self.entries = {}  # sid -> LobbyEntry
+        self.index = []    # sorted [entry.key()], lowest rating first
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, sid):
+        return sid in self.entries
+
+    # --- QUEUE MANAGEMENT ---
+    def join(self, sid, name, rating, now=None):
+        if sid in self.entries: return
+        entry = LobbyEntry(sid, name, rating, now if now is not None else time.time())
+        self.entries[sid] = entry
+        bisect.insort(self.index, entry.key())
+
+    def leave(self, sid):
+        entry = self.entries.pop(sid, None)
+        if entry is None: return None
+        pos = bisect.bisect_left(self.index, entry.key())
+        del self.index[pos]
+        return entry
+
+    def set_latency(self, sid, latency_ms):
+        entry = self.entries.get(sid)
+        if entry: entry.latency = latency_ms
+
+    def position(self, sid):
+        # 1-based place in the queue by waiting time
+        entry = self.entries.get(sid)
+        if entry is None: return None
+        return 1 + sum(1 for other in self.entries.values() if other.joined_at < entry.joined_at)
+
+    # --- MATCHING ---
+    def fits(self, group, now):
+        ratings = [e.rating for e in group]
+        latencies = [e.latency for e in group if e.latency is not None]
+        if max(ratings) - min(ratings) > min(e.rating_band(now) for e in group):
+            return False
+        if latencies and max(latencies) - min(latencies) > min(e.latency_spread(now) for e in group):
+            return False
+        return True
+
+    def tick(self, now=None, max_tables=None):
+        # Returns [(humans, bot_count), ...] and takes those players out of the queue
+        now = now if now is not None else time.time()
+        tables = []
+
+        # 1. Full human tables: slide a window of 4 over the rating order
+        i = 0
+        while i + TABLE_SIZE <= len(self.index) and (max_tables is None or len(tables) < max_tables):
+            group = [self.entries[key[2]] for key in self.index[i:i + TABLE_SIZE]]
+            if self.fits(group, now):
+                tables.append((group, 0))
+                for entry in group: self.leave(entry.sid)
+            else:
+                i += 1
+
+        # 2. Anyone who waited too long gets their nearest neighbours plus bots
+        overdue = sorted((e for e in self.entries.values() if now - e.joined_at >= self.bot_backfill_seconds),
+                         key=lambda e: e.joined_at)
+        for entry in overdue:
+            if max_tables is not None and len(tables) >= max_tables: break
+            if entry.sid not in self.entries: continue # Already seated as someone's neighbour
+            group = [entry] + self.nearest(entry, TABLE_SIZE - 1, now)
+            tables.append((group, TABLE_SIZE - len(group)))
+            for member in group: self.leave(member.sid)
+
+        return tables
+
+    def nearest(self, entry, count, now):
+        # Closest ratings on either side of entry that still fit with it
+        pos = bisect.bisect_left(self.index, entry.key())
+        lo, hi = pos - 1, pos + 1
+        picked = []
+        while len(picked) < count and (lo >= 0 or hi < len(self.index)):
+            below = self.entries[self.index[lo][2]] if lo >= 0 else None
+            above = self.entries[self.index[hi][2]] if hi < len(self.index) else None
+            if above is None or (below is not None and entry.rating - below.rating <= above.rating - entry.rating):
+                candidate, lo = below, lo - 1
+                if entry.rating - candidate.rating > entry.rating_band(now): lo = -1 # Everyone further down is worse
+            else:
+                candidate, hi = above, hi + 1
+                if candidate.rating - entry.rating > entry.rating_band(now): hi = len(self.index)
+            if self.fits([entry] + picked + [candidate], now):
+                picked.append(candidate)
+        return picked
+
+    def metrics(self, now=None):
+        now = now if now is not None else time.time()
+        waits = [now - e.joined_at for e in self.entries.values()]
+        return {'waiting': len(waits), 'longest_wait': round(max(waits), 1) if waits else 0}
@@ -0,0 +1,142 @@
+"""Per-client outbound queues.
+
+Every message to a browser is put on that client's own bounded queue and
+sent by a small background task per client. A player on a stalled
+connection therefore only backs up their own queue, and never the
+handler that is talking to the whole table.
+
+While a client is behind:
+* "latest state wins" messages (scores, turn indicator, hand) replace the
+  older copy still waiting in the queue instead of piling up, and chat
+  batches are merged, so chat never holds more than one slot;
+* once the queue overflows it is thrown away and replaced by a fresh
+  resync of the table (the same care package a reconnecting player gets).
+  Table prompts the client has to answer (ready button, ace hunt,
+  scoreboard, game over, reload) are never thrown away: the rest of the
+  table would wait on this client forever. Only the latest of each is kept.
+"""
+import copy
+from collections import Counter, deque
+
+MAX_QUEUE_DEPTH = 64
+TRANSPORT_BACKLOG_LIMIT = 16   # Packets already handed to the socket but not yet written
+BACKLOG_POLL_SECONDS = 0.05
+
+SUPERSEDED_EVENTS = {'update_scores', 'update_turn_indicator', 'hand_update', 'update_player_list'}
+MERGED_EVENTS = {'receive_chat_batch': 'messages'}  # event -> list that gets concatenated
+KEPT_ON_OVERFLOW = {'enable_ready_btn', 'ace_hunt_animation', 'show_end_round_scoreboard', 'game_over_event', 'force_reload'}
+
+
+class ClientQueue:
+    def __init__(self, sid, wakeup):
+        self.sid = sid
+        self.messages = deque()
+        self.wakeup = wakeup
+        self.connected = True
+        self.counters = Counter()
+
+
+class Outbox:
+    def __init__(self, socketio, resync=None, max_depth=MAX_QUEUE_DEPTH):
+        self.socketio = socketio
+        self.resync = resync  # sid -> [(event, data), ...] that rebuilds the client's screen
+        self.max_depth = max_depth
+        self.clients = {}
+        self.totals = Counter()
+
+    # --- CONNECTION LIFECYCLE ---
+    def connect(self, sid):
+        client = ClientQueue(sid, self.socketio.server.eio.create_event())
+        self.clients[sid] = client
+        self.socketio.start_background_task(self._drain, client)
+
+    def disconnect(self, sid):
+        client = self.clients.pop(sid, None)
+        if client:
+            client.connected = False
+            client.wakeup.set()
+
+    # --- SENDING ---
+    def send(self, sid, event, data, frozen=False):
+        # Handlers keep mutating the game after they emit, so the queue holds
+        # a snapshot of what the table looked like at emit time.
+        if not frozen: data = copy.deepcopy(data)
+        client = self.clients.get(sid)
+        if client is None: return # Not connected (or a stale sid): nothing to deliver to
+
+        if event in SUPERSEDED_EVENTS or event in MERGED_EVENTS:
+            for old in client.messages:
+                if old[0] == event:
+                    client.messages.remove(old)
+                    self._count(client, 'coalesced')
+                    if event in MERGED_EVENTS:
+                        key = MERGED_EVENTS[event]
+                        data = dict(data, **{key: old[1][key] + data[key]})
+                    break
+
+        client.messages.append((event, data))
+        if len(client.messages) > self.max_depth:
+            self._overflow(client)
+
+        client.counters['max_depth'] = max(client.counters['max_depth'], len(client.messages))
+        client.wakeup.set()
+
+    def broadcast(self, event, data):
+        data = copy.deepcopy(data) # One snapshot shared by every client
+        for sid in list(self.clients):
+            self.send(sid, event, data, frozen=True)
+
+    def _overflow(self, client):
+        kept = {}
+        for event, data in client.messages:
+            if event in KEPT_ON_OVERFLOW:
+                kept.pop(event, None) # Re-insert so the latest keeps its place in line
+                kept[event] = data
+        self._count(client, 'dropped', len(client.messages) - len(kept))
+        self._count(client, 'resyncs')
+        client.messages.clear()
+        if self.resync:
+            # Same snapshot rule as send(): the resync is built from the live table
+            client.messages.extend(copy.deepcopy(self.resync(client.sid)))
+        client.messages.extend(kept.items())
+
+    def _count(self, client, key, amount=1):
+        client.counters[key] += amount
+        self.totals[key] += amount
+
+    # --- DELIVERY (one background task per client) ---
+    def _drain(self, client):
+        while client.connected:
+            if not client.messages:
+                client.wakeup.wait()
+                client.wakeup.clear()
+                continue
+
+            # The socket itself is still chewing on earlier packets: let our
+            # own queue absorb (and coalesce) the backlog instead.
+            if self._transport_backlog(client.sid) > TRANSPORT_BACKLOG_LIMIT:
+                self.socketio.sleep(BACKLOG_POLL_SECONDS)
+                continue
+
+            event, data = client.messages.popleft()
+            self.socketio.emit(event, data, to=client.sid)
+            self._count(client, 'sent')
+            self.socketio.sleep(0)
+
+    def _transport_backlog(self, sid):
+        try:
+            eio_sid = self.socketio.server.manager.eio_sid_from_sid(sid, '/')
+            return self.socketio.server.eio.sockets[eio_sid].queue.qsize()
+        except (AttributeError, KeyError, TypeError):
+            return 0
+
+    # --- METRICS ---
+    def metrics(self):
+        return {
+            'clients': len(self.clients),
+            'totals': dict(self.totals),
+            'per_client': {
+                sid: dict(client.counters, depth=len(client.messages))
+                for sid, client in self.clients.items()
+            }
+        }
@@ -0,0 +1,210 @@
+"""On-demand profiling for the live server.
+
+Two kinds of session, both started from the admin endpoints in app.py:
+
+* "handler" - traces the next N invocations of a named function (a socket
+  handler like handle_play_card, or anything it calls such as
+  broadcast_scores or calculate_round_scores) and records wall time per
+  call stack.
+* "sample" - a background thread peeks at the main thread's stack every few
+  milliseconds, whatever it happens to be doing.
+
+Every session has a hard deadline, so a forgotten one switches itself off.
+Results come out as collapsed stacks ("a;b;c 42", ready for flamegraph.pl
+or speedscope) plus per-function self/total figures.
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+MAX_SESSION_SECONDS = 300
+MAX_HANDLER_CALLS = 1000
+MIN_SAMPLE_INTERVAL = 0.001
+KEEP_FINISHED_SESSIONS = 10
+EXPIRY_CHECK_EVENTS = 10000  # Profile events between two deadline checks
+
+_session_ids = itertools.count(1)
+sessions = OrderedDict()   # id -> session, oldest first
+_active_handler_session = None
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class ProfileSession:
+    unit = 'samples'
+
+    def __init__(self, seconds):
+        self.id = next(_session_ids)
+        self.started_at = time.time()
+        self.expires_at = self.started_at + min(seconds, MAX_SESSION_SECONDS)
+        self.stopped = False
+        self.stacks = Counter()  # "outer;...;inner" -> weight
+        self.lock = threading.Lock()  # The sampler thread writes stacks while reports read them
+
+    @property
+    def finished(self):
+        return self.stopped or time.time() >= self.expires_at
+
+    def stop(self):
+        self.stopped = True
+
+    def snapshot(self):
+        with self.lock: return Counter(self.stacks)
+
+    def collapsed(self):
+        lines = [f"{stack} {int(weight)}" for stack, weight in self.snapshot().most_common()]
+        return "\n".join(lines) + "\n"
+
+    def function_totals(self):
+        self_weight = Counter()
+        total_weight = Counter()
+        for stack, weight in self.snapshot().items():
+            frames = stack.split(';')
+            self_weight[frames[-1]] += weight
+            for name in set(frames): total_weight[name] += weight
+        return [
+            {'function': name, 'self': int(self_weight[name]), 'total': int(total)}
+            for name, total in total_weight.most_common()
+        ]
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'unit': self.unit,
+            'finished': self.finished,
+            'expires_in': max(0, round(self.expires_at - time.time(), 1)),
+        }
+
+    def report(self):
+        return dict(self.summary(), functions=self.function_totals())
+
+
+class HandlerSession(ProfileSession):
+    kind = 'handler'
+    unit = 'microseconds'
+
+    def __init__(self, target, calls, seconds):
+        super().__init__(seconds)
+        self.target = target
+        self.calls_left = min(calls, MAX_HANDLER_CALLS)
+
+    @property
+    def finished(self):
+        return self.calls_left <= 0 or super().finished
+
+    def summary(self):
+        return dict(super().summary(), target=self.target, calls_left=self.calls_left)
+
+    # One profile hook for the whole session, not one per call: handlers are
+    # greenlets that sleep mid-call, so per-call save/restore would unwind out
+    # of order and leave the hook behind.
+    def install(self):
+        self.open_frames = {}  # frame -> [start, time spent in children]
+        self.events_until_check = EXPIRY_CHECK_EVENTS
+        self.previous_hook = sys.getprofile()
+        self.hook = self._trace
+        sys.setprofile(self.hook)
+
+    def stop(self):
+        super().stop()
+        if sys.getprofile() is getattr(self, 'hook', None):
+            sys.setprofile(self.previous_hook)
+
+    def _trace(self, frame, event, arg):
+        self.events_until_check -= 1
+        if self.events_until_check <= 0:
+            # Deadline check without a clock read on every call
+            self.events_until_check = EXPIRY_CHECK_EVENTS
+            if self.finished: return self.stop()
+        if event == 'call':
+            # Only the target and what it calls; anything else is a dict miss
+            if frame.f_code.co_name == self.target or frame.f_back in self.open_frames:
+                if self.finished:
+                    self.stop()
+                    return
+                self.open_frames[frame] = [time.perf_counter(), 0.0]
+        elif event == 'return':
+            entry = self.open_frames.pop(frame, None)
+            if entry is None: return
+            elapsed = time.perf_counter() - entry[0]
+            parent = self.open_frames.get(frame.f_back)
+            if parent: parent[1] += elapsed
+            self._record(frame, elapsed - entry[1])
+
+    def _record(self, frame, self_time):
+        # Walk up to the target; frames from other greenlets never reach it
+        labels = []
+        f = frame
+        while f is not None:
+            labels.append(frame_label(f))
+            if f.f_code.co_name == self.target: break
+            f = f.f_back
+        if f is None or self.finished: return
+
+        self.stacks[';'.join(reversed(labels))] += self_time * 1e6
+        if f is frame:
+            self.calls_left -= 1
+            if self.finished: self.stop()
+
+
+class SamplingSession(ProfileSession):
+    kind = 'sample'
+
+    def __init__(self, seconds, interval):
+        super().__init__(seconds)
+        self.interval = max(interval, MIN_SAMPLE_INTERVAL)
+        self.thread_id = threading.main_thread().ident
+        threading.Thread(target=self._sample_loop, daemon=True).start()
+
+    def summary(self):
+        return dict(super().summary(), interval=self.interval)
+
+    def _sample_loop(self):
+        while not self.finished:
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                with self.lock: self.stacks[';'.join(reversed(labels))] += 1
+            time.sleep(self.interval)
+
+
+def _remember(session):
+    sessions[session.id] = session
+    # Keep a handful of finished reports around, drop the rest
+    finished = [sid for sid, s in sessions.items() if s.finished]
+    for sid in finished[:-KEEP_FINISHED_SESSIONS]:
+        del sessions[sid]
+    return session
+
+
+def start_handler_session(target, calls=20, seconds=60):
+    global _active_handler_session
+    if _active_handler_session and not _active_handler_session.finished:
+        _active_handler_session.stop()
+    _active_handler_session = _remember(HandlerSession(target, calls, seconds))
+    _active_handler_session.install()
+    return _active_handler_session
+
+
+def start_sampling_session(seconds=10, interval=0.005):
+    return _remember(SamplingSession(seconds, interval))
+
+
+def run(func, *args, **kwargs):
+    # Called around every socket handler. The hook is the session's, this
+    # only makes sure an expired one is switched off even if nothing it
+    # traces ever runs again.
+    session = _active_handler_session
+    if session is not None and session.finished and not session.stopped:
+        session.stop()
+    return func(*args, **kwargs)
@@ -0,0 +1,110 @@
+"""Persistent player ratings and the leaderboard.
+
+Ratings use a multiplayer Elo: each finished game counts as a head-to-head
+result between every pair of players at the table (higher final score wins,
+equal scores draw). The K-factor is shared out over the opponents.
+
+Only the four players of a finished game are touched. The leaderboard is a
+sorted list of (-rating, name) kept up to date with bisect, so "top N" is a
+slice and "my rank" is a binary search. Nothing is ever recomputed from
+scratch.
+"""
+import bisect
+import json
+import os
+
+INITIAL_RATING = 1500
+K_FACTOR = 32
+
+
+class Leaderboard:
+    def __init__(self, path, k_factor=K_FACTOR, initial_rating=INITIAL_RATING):
+        self.path = path
+        self.k_factor = k_factor
+        self.initial_rating = initial_rating
+        self.players = {}   # name -> {'rating': float, 'games': int}
+        self.index = []     # sorted [(-rating, name)], best first
+        self.version = 0    # Bumped on every change (used for HTTP caching)
+        self.load()
+
+    # --- PERSISTENCE ---
+    def load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path) as f:
+                self.players = json.load(f)['players']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  Could not load ratings from {self.path}: {e}")
+            self.players = {}
+        self.index = sorted((-p['rating'], name) for name, p in self.players.items())
+        # Keeps ETags moving forward across restarts
+        self.version = sum(p['games'] for p in self.players.values())
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'players': self.players}, f)
+        os.replace(tmp_path, self.path)
+
+    # --- RATING UPDATES ---
+    def rating(self, name):
+        return self.players.get(name, {}).get('rating', self.initial_rating)
+
+    def record_game(self, final_scores):
+        # final_scores: {name: points}. Returns {name: (old_rating, new_rating)}
+        names = list(final_scores)
+        if len(names) < 2: return {}
+
+        old = {name: self.rating(name) for name in names}
+        share = self.k_factor / (len(names) - 1)
+        changes = {}
+
+        for name in names:
+            delta = 0.0
+            for other in names:
+                if other == name: continue
+                expected = 1 / (1 + 10 ** ((old[other] - old[name]) / 400))
+                if final_scores[name] > final_scores[other]: actual = 1.0
+                elif final_scores[name] == final_scores[other]: actual = 0.5
+                else: actual = 0.0
+                delta += share * (actual - expected)
+            changes[name] = (old[name], old[name] + delta)
+
+        for name, (before, after) in changes.items():
+            self._reindex(name, before, after)
+
+        self.version += 1
+        self.save()
+        return changes
+
+    def _reindex(self, name, before, after):
+        entry = self.players.get(name)
+        if entry is not None:
+            pos = bisect.bisect_left(self.index, (-before, name))
+            if pos < len(self.index) and self.index[pos] == (-before, name):
+                del self.index[pos]
+        else:
+            entry = self.players[name] = {'rating': before, 'games': 0}
+
+        entry['rating'] = after
+        entry['games'] += 1
+        bisect.insort(self.index, (-after, name))
+
+    # --- QUERIES ---
+    def top(self, n=10):
+        return [self._row(pos) for pos in range(min(n, len(self.index)))]
+
+    def rank(self, name):
+        entry = self.players.get(name)
+        if entry is None: return None
+        pos = bisect.bisect_left(self.index, (-entry['rating'], name))
+        return self._row(pos)
+
+    def _row(self, pos):
+        neg_rating, name = self.index[pos]
+        return {
+            'rank': pos + 1,
+            'name': name,
+            'rating': round(-neg_rating),
+            'games': self.players[name]['games'],
+        }
@@ -0,0 +1,185 @@
+"""Recording games to disk and streaming them back to viewers.
+
+Every game gets two append-only files in the replay directory:
+
+* <game_id>.jsonl      - one line per table event: {"t", "event", "data"}
+* <game_id>.keys.jsonl - one keyframe per round start and per trick start,
+                         holding the byte offset to resume from plus the
+                         offsets of the latest seating, scoreboard and deal
+
+A viewer can therefore jump straight to any round or trick: we seek to the
+keyframe, send the seating, scoreboard and deal as they were at that moment, and
+carry on reading line by line. Nothing is held in memory per viewer except
+an open file, so a popular game can have as many viewers as we like.
+"""
+import json
+import os
+import re
+import time
+
+RECORDED_EVENTS = {
+    'update_player_list', 'update_scores', 'new_round', 'update_turn_indicator',
+    'card_played_on_table', 'joker_action', 'animate_trick_winner', 'clear_table',
+    'log_message',
+}
+MAX_PAUSE_SECONDS = 3.0  # Long waits (scoreboard, players AFK) are squeezed to this
+GAME_ID_PATTERN = re.compile(r'[0-9a-f]{1,32}')
+
+
+def valid_game_id(game_id):
+    return bool(GAME_ID_PATTERN.fullmatch(game_id or ''))
+
+
+def replay_paths(directory, game_id):
+    base = os.path.join(directory, game_id)
+    return base + '.jsonl', base + '.keys.jsonl'
+
+
+class ReplayRecorder:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.game_id = None
+        self.events_file = None
+        self.keys_file = None
+
+    def _open(self, game_id):
+        self.close()
+        events_path, keys_path = replay_paths(self.directory, game_id)
+        self.game_id = game_id
+        self.events_file = open(events_path, 'a')
+        self.keys_file = open(keys_path, 'a')
+        self.started_at = time.time()
+        self.round_number = 0
+        self.trick = 0
+        self.last_new_round = None
+        self.offsets = {'update_scores': None, 'update_player_list': None, 'new_round': None}
+        self._resume(events_path, keys_path)
+
+    def _resume(self, events_path, keys_path):
+        # Same game after a restart or handoff: carry on where the files stop,
+        # so timestamps keep counting and the current round still gets keyframes
+        last_t = None
+        with open(events_path) as f:
+            offset = f.tell()
+            for raw in iter(f.readline, ''):
+                if raw.strip():
+                    line = json.loads(raw)
+                    last_t = line['t']
+                    if line['event'] in self.offsets: self.offsets[line['event']] = offset
+                    if line['event'] == 'new_round': self.last_new_round = line['data']
+                offset = f.tell()
+        if last_t is None: return
+        self.started_at = time.time() - last_t
+
+        last_key = None
+        with open(keys_path) as f:
+            for raw in f:
+                if raw.strip(): last_key = json.loads(raw)
+        if last_key:
+            self.round_number, self.trick = last_key['round'], last_key['trick']
+
+    def close(self):
+        for f in (self.events_file, self.keys_file):
+            if f: f.close()
+        self.events_file = self.keys_file = None
+
+    def record(self, game_id, event, data):
+        if event not in RECORDED_EVENTS: return
+        if game_id != self.game_id: self._open(game_id)
+
+        if event == 'new_round':
+            # Sent once per seat with that seat's hand: keep a single, hand-less copy
+            data = dict(data, hand=[])
+            if data == self.last_new_round: return
+            self.last_new_round = data
+
+        offset = self.events_file.tell()
+        if event == 'new_round' and data['round_number'] != self.round_number:
+            self.round_number = data['round_number']
+            self.trick = 1
+            self._keyframe(offset)
+
+        self.events_file.write(json.dumps({
+            't': round(time.time() - self.started_at, 3),
+            'event': event,
+            'data': data
+        }) + '\n')
+        self.events_file.flush() # Games in progress can be watched too
+
+        if event in self.offsets:
+            self.offsets[event] = offset
+        elif event == 'clear_table' and self.round_number:
+            self.trick += 1
+            # The round's last trick is cleared too, but no trick follows it
+            if self.trick <= self.last_new_round['max_bid']:
+                self._keyframe(self.events_file.tell())
+
+    def _keyframe(self, offset):
+        self.keys_file.write(json.dumps({
+            'round': self.round_number,
+            'trick': self.trick,
+            'offset': offset,
+            'scores_offset': self.offsets['update_scores'],
+            'players_offset': self.offsets['update_player_list'],
+            # Mid-round keyframes also need the round's trump / deal banner
+            'round_offset': self.offsets['new_round'] if self.trick > 1 else None,
+        }) + '\n')
+        self.keys_file.flush()
+
+
+class ReplayLibrary:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def exists(self, game_id):
+        return valid_game_id(game_id) and os.path.exists(replay_paths(self.directory, game_id)[0])
+
+    def list_games(self):
+        games = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.jsonl') and not name.endswith('.keys.jsonl'):
+                path = os.path.join(self.directory, name)
+                games.append({'game_id': name[:-len('.jsonl')], 'updated_at': os.path.getmtime(path)})
+        return sorted(games, key=lambda g: g['updated_at'], reverse=True)
+
+    def keyframes(self, game_id):
+        # Small file (one line per trick), read lazily
+        keys_path = replay_paths(self.directory, game_id)[1]
+        if not os.path.exists(keys_path): return
+        with open(keys_path) as f:
+            for line in f:
+                if line.strip(): yield json.loads(line)
+
+    def find_keyframe(self, game_id, round_number=None, trick=None):
+        # Latest keyframe at or before the requested (round, trick)
+        if not round_number: return None
+        target = (round_number, trick or 1)
+        best = None
+        for key in self.keyframes(game_id):
+            if (key['round'], key['trick']) > target: break
+            best = key
+        return best
+
+    def stream(self, game_id, round_number=None, trick=None):
+        # Yields (pause_seconds, event, data) from the requested point on
+        events_path = replay_paths(self.directory, game_id)[0]
+        key = self.find_keyframe(game_id, round_number, trick)
+
+        with open(events_path) as f:
+            if key:
+                # Rebuild the table as it looked at the keyframe
+                for offset in (key['players_offset'], key['scores_offset'], key['round_offset']):
+                    if offset is None: continue
+                    f.seek(offset)
+                    line = json.loads(f.readline())
+                    yield 0, line['event'], line['data']
+                f.seek(key['offset'])
+
+            last_t = None
+            for raw in f:
+                if not raw.strip(): continue
+                line = json.loads(raw)
+                pause = 0 if last_t is None else min(line['t'] - last_t, MAX_PAUSE_SECONDS)
+                last_t = line['t']
+                yield max(pause, 0), line['event'], line['data']